@@ -3,6 +3,7 @@ import wave
 from io import BytesIO
 
 from chains import build_vision_chat_chain
+from common.metrics import instrument
 from fastapi import (
     FastAPI,
     File,
@@ -23,6 +24,7 @@ chat_chain = build_chat_chain(CHAT_SYS_MSG)
 
 ws_conn_manager = ConnectionManager()
 app = FastAPI()
+instrument(app)
 
 
 @app.websocket("/ws/chat")
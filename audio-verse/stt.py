@@ -1,6 +1,7 @@
 import time
 from io import BytesIO
 
+from common.metrics import track_inference
 from load_models import load_whisper_model
 from loguru import logger
 
@@ -9,10 +10,12 @@ def transcribe_audio(buffer: BytesIO) -> str:
     try:
         whisper_model = load_whisper_model()
         start = time.time()
-        segs, _ = whisper_model.transcribe(buffer, beam_size=5)
+        with track_inference("whisper"):
+            segs, _ = whisper_model.transcribe(buffer, beam_size=5)
+            # segments are decoded lazily, while iterating
+            res = " ".join([seg.text for seg in segs])
         tot = time.time() - start
         logger.debug(f"Transcription time: {tot:.2f} seconds")
-        res = " ".join([seg.text for seg in segs])
         return res
     except Exception as e:
         logger.error(f"Transcription error: {e}")
@@ -5,6 +5,7 @@ from importlib.resources import files
 
 import librosa
 import numpy as np
+from common.metrics import observe_tts
 from load_models import load_f5_tts_model
 from loguru import logger
 
@@ -28,6 +29,7 @@ def text_to_speech(text: str) -> io.BytesIO:
         generation_time = time.time() - t0
         audio_duration = len(wav_np) / sr
         rtf = generation_time / audio_duration
+        observe_tts("f5_tts", generation_time, audio_duration)
         logger.debug(f"Generated in {generation_time:.2f}s")
         logger.debug(f"Real-Time Factor (RTF): {rtf:.2f}")
         wav_np = np.clip(wav_np, -1, 1)
@@ -0,0 +1,69 @@
+"""Guard the import cost of the svd_service API process.
+
+Imports `svd_service.app` in a fresh interpreter, reports wall time and
+peak RSS, and exits non-zero when a budget is exceeded or a worker-only
+library got pulled in. Needs the same environment (.env) as the API.
+
+    python -m benchmarks.bench_api_import --max-seconds 1.0 --max-rss-mb 200
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# libraries only the workers need, the API must never load them
+FORBIDDEN = ("torch", "diffusers", "transformers", "accelerate", "moviepy", "cv2")
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import svd_service.app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure() -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE % (FORBIDDEN,)],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        sys.exit(f"importing svd_service.app failed with code {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    parser.add_argument("--max-rss-mb", type=float, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    # the first run also pays for cold .pyc compilation and disk cache misses
+    best = min(runs, key=lambda run: run["seconds"])
+    for run in runs:
+        print(f"import {run['seconds']:.3f}s, peak rss {run['rss_mb']:.1f} MB")
+
+    failures = []
+    if best["loaded"]:
+        failures.append(f"worker-only modules imported: {', '.join(best['loaded'])}")
+    if best["seconds"] > args.max_seconds:
+        failures.append(f"import took {best['seconds']:.3f}s > {args.max_seconds}s")
+    if best["rss_mb"] > args.max_rss_mb:
+        failures.append(f"peak rss {best['rss_mb']:.1f} MB > {args.max_rss_mb} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
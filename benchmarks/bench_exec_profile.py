@@ -0,0 +1,176 @@
+"""Compare execution profiles on a tiny randomly initialised SVD pipeline.
+
+The components have the shapes of the diffusers SVD test fixtures, so this
+runs on a laptop CPU in seconds; the numbers show the relative overhead of
+offloading, not real SVD latency. GPU profiles are skipped without cuda.
+Each run happens in a fresh process so peak memory is not shared.
+
+    python -m benchmarks.bench_exec_profile --threads 1,4
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+from common.exec_profile import PROFILES
+
+
+def _tiny_pipe():
+    import torch
+    from diffusers import (
+        AutoencoderKLTemporalDecoder,
+        EulerDiscreteScheduler,
+        StableVideoDiffusionPipeline,
+        UNetSpatioTemporalConditionModel,
+    )
+    from transformers import (
+        CLIPImageProcessor,
+        CLIPVisionConfig,
+        CLIPVisionModelWithProjection,
+    )
+
+    torch.manual_seed(0)
+    unet = UNetSpatioTemporalConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=2,
+        sample_size=32,
+        in_channels=8,
+        out_channels=4,
+        down_block_types=(
+            "CrossAttnDownBlockSpatioTemporal",
+            "DownBlockSpatioTemporal",
+        ),
+        up_block_types=("UpBlockSpatioTemporal", "CrossAttnUpBlockSpatioTemporal"),
+        cross_attention_dim=32,
+        num_attention_heads=8,
+        projection_class_embeddings_input_dim=96,
+        addition_time_embed_dim=32,
+    )
+    scheduler = EulerDiscreteScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        interpolation_type="linear",
+        num_train_timesteps=1000,
+        prediction_type="v_prediction",
+        sigma_max=700.0,
+        sigma_min=0.002,
+        steps_offset=1,
+        timestep_spacing="leading",
+        timestep_type="continuous",
+        use_karras_sigmas=True,
+    )
+    vae = AutoencoderKLTemporalDecoder(
+        block_out_channels=[32, 64],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        latent_channels=4,
+    )
+    # the pipeline resizes its conditioning image to 224 for CLIP
+    image_encoder = CLIPVisionModelWithProjection(
+        CLIPVisionConfig(
+            hidden_size=32,
+            projection_dim=32,
+            num_hidden_layers=5,
+            num_attention_heads=4,
+            image_size=224,
+            intermediate_size=37,
+            patch_size=14,
+        )
+    )
+    return StableVideoDiffusionPipeline(
+        vae=vae,
+        image_encoder=image_encoder,
+        unet=unet,
+        scheduler=scheduler,
+        feature_extractor=CLIPImageProcessor(crop_size=224, size=224),
+    )
+
+
+def _run(variant: dict, args: argparse.Namespace, queue: mp.Queue) -> None:
+    import torch
+    from PIL import Image
+
+    from common.exec_profile import apply_profile
+
+    pipe = _tiny_pipe()
+    pipe.set_progress_bar_config(disable=True)
+    device = "cpu" if variant["profile"] == "cpu" else "cuda"
+    apply_profile(
+        pipe,
+        variant["profile"],
+        device,
+        vae_slicing=args.vae_slicing,
+        vae_tiling=args.vae_tiling,
+        cpu_threads=variant["threads"],
+    )
+    image = Image.new("RGB", (args.size, args.size))
+    kwargs = dict(
+        width=args.size,
+        height=args.size,
+        num_frames=args.frames,
+        num_inference_steps=args.steps,
+        decode_chunk_size=args.frames,
+        output_type="pt",
+    )
+    sync = torch.cuda.synchronize if device == "cuda" else lambda: None
+    with torch.inference_mode():
+        pipe(image, **kwargs)  # warm up kernels and offload hooks
+        sync()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            pipe(image, **kwargs)
+        sync()
+    elapsed = (time.perf_counter() - start) / args.repeat
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    vram = torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else 0.0
+    queue.put((elapsed, rss, vram))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=str, default=",".join(PROFILES))
+    # cpu thread counts to compare, 0 keeps the torch default
+    parser.add_argument("--threads", type=str, default="0")
+    parser.add_argument("--vae-slicing", action="store_true")
+    parser.add_argument("--vae-tiling", action="store_true")
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import torch
+
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    threads = [int(n) for n in args.threads.split(",")]
+    variants = []
+    for profile in profiles:
+        if profile not in PROFILES:
+            parser.error(f"unknown profile {profile}")
+        if profile != "cpu" and not torch.cuda.is_available():
+            print(f"{profile}: skipped, cuda is not available")
+            continue
+        # thread counts matter for cpu execution only
+        for n in threads if profile == "cpu" else [0]:
+            variants.append({"profile": profile, "threads": n})
+
+    ctx = mp.get_context("spawn")
+    print(f"{'profile':<20} {'threads':>7} {'s/call':>8} {'rss MB':>8} {'vram MB':>8}")
+    for variant in variants:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(variant, args, queue))
+        proc.start()
+        proc.join()
+        label = f"{variant['profile']:<20} {variant['threads'] or '-':>7}"
+        if proc.exitcode != 0:
+            print(f"{label} failed with exit code {proc.exitcode}")
+            continue
+        elapsed, rss, vram = queue.get()
+        print(f"{label} {elapsed:>8.3f} {rss:>8.1f} {vram:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
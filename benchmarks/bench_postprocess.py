@@ -0,0 +1,91 @@
+"""Compare per-frame PIL post-processing with the batched torch resize.
+
+`pil` mirrors the former path: the pipeline converts every frame to a PIL
+image, each one is resized with LANCZOS and converted back for the encoder.
+`torch` is `_restore_aspect`, a single interpolate over the whole video.
+Each path runs in a fresh process so peak RSS is not polluted by the other.
+
+    python -m benchmarks.bench_postprocess --frames 25 --width 1024 --aspect 0.75
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+SVD_HEIGHT = 576
+
+
+def _make_video(n: int, width: int, height: int):
+    import torch
+
+    generator = torch.Generator().manual_seed(0)
+    return torch.rand((n, 3, height, width), generator=generator)
+
+
+def _pil(video, width: int, height: int) -> np.ndarray:
+    from PIL import Image
+
+    # what diffusers does for output_type="pil"
+    arrays = (video.permute(0, 2, 3, 1).numpy() * 255).round().astype("uint8")
+    imgs = [Image.fromarray(frame) for frame in arrays]
+    resized = [img.resize((width, height), Image.Resampling.LANCZOS) for img in imgs]
+    return np.stack([np.asarray(img) for img in resized])
+
+
+def _torch(video, width: int, height: int) -> np.ndarray:
+    from worker.tasks.svd import _restore_aspect
+
+    return _restore_aspect(video, width, height)
+
+
+def _run(name: str, args: argparse.Namespace, queue: mp.Queue) -> None:
+    import torch
+
+    torch.set_num_threads(args.threads)
+    height = int(args.width * args.aspect)
+    video = _make_video(args.frames, args.width, SVD_HEIGHT)
+    fn = {"pil": _pil, "torch": _torch}[name]
+    fn(video, args.width, height)  # warm up lazy imports and kernels
+
+    start = time.perf_counter()
+    tracemalloc.start()
+    out = fn(video, args.width, height)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    assert out.shape == (args.frames, height, args.width, 3), out.shape
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((name, elapsed, traced_peak / 2**20, rss / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=25)
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--aspect", type=float, default=0.75)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    # tracemalloc sees numpy and PIL buffers, torch allocations only show in RSS
+    print(f"{'path':<8} {'wall s':>8} {'traced MB':>10} {'peak rss MB':>12}")
+    for name in ("pil", "torch"):
+        for _ in range(args.repeat):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(name, args, queue))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                print(f"{name:<8} failed with exit code {proc.exitcode}")
+                break
+            name_, elapsed, traced, rss = queue.get()
+            print(f"{name_:<8} {elapsed:>8.3f} {traced:>10.1f} {rss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the moviepy re-encode round trip with the single-pass encoder.
+
+Each path runs in a fresh process so peak RSS is not polluted by the other.
+
+    python -m benchmarks.bench_video_encode --frames 25 --width 1024 --height 576
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def _make_frames(n: int, width: int, height: int) -> np.ndarray:
+    # smooth moving gradient, closer to real footage than random noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = np.empty((n, height, width, 3), dtype=np.uint8)
+    for i in range(n):
+        frames[i, ..., 0] = (x + i * 8) % 256
+        frames[i, ..., 1] = (y + i * 4) % 256
+        frames[i, ..., 2] = ((x + y) / 2 + i * 2) % 256
+    return frames
+
+
+def _legacy(frames: np.ndarray, output_path: str, crf: int, preset: str) -> None:
+    from diffusers.utils import export_to_video
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
+
+    imgs = [Image.fromarray(frame) for frame in frames]
+    export_to_video(imgs, output_path, fps=6)
+    clip = VideoFileClip(output_path)
+    clip = concatenate_videoclips([clip])
+    clip.write_videofile(output_path, logger=None)
+
+
+def _streaming(frames: np.ndarray, output_path: str, crf: int, preset: str) -> None:
+    from worker.tasks.encoder import encode_frames
+
+    encode_frames(frames, output_path, fps=6, crf=crf, preset=preset)
+
+
+def _run(name: str, args: argparse.Namespace, queue: mp.Queue) -> None:
+    frames = _make_frames(args.frames, args.width, args.height)
+    fn = {"legacy": _legacy, "streaming": _streaming}[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "out.mp4")
+        start = time.perf_counter()
+        fn(frames, output_path, args.crf, args.preset)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(output_path)
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put((name, elapsed, self_rss / 1024, child_rss / 1024, size / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=25)
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=576)
+    parser.add_argument("--crf", type=int, default=23)
+    parser.add_argument("--preset", type=str, default="medium")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(
+        f"{'path':<10} {'wall s':>8} {'py rss MB':>10} {'ffmpeg rss MB':>14} {'KB':>8}"
+    )
+    for name in ("legacy", "streaming"):
+        for _ in range(args.repeat):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(name, args, queue))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                print(f"{name:<10} failed with exit code {proc.exitcode}")
+                break
+            name_, elapsed, self_rss, child_rss, size = queue.get()
+            print(
+                f"{name_:<10} {elapsed:>8.2f} {self_rss:>10.1f} "
+                f"{child_rss:>14.1f} {size:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Celery app configuration shared by the API and the workers.
+
+The API only sends tasks by name and reads results, so it builds its app
+from here and never imports the worker modules (torch, diffusers).
+"""
+
+from functools import lru_cache
+
+from celery import Celery
+from kombu import Queue
+
+from common.config import env_settings
+from common.lanes import lane_queues
+
+IMG_TO_VIDEO_TASK = "img_to_video"
+IMG_TO_VIDEO_BATCH_TASK = "img_to_video_batch"
+
+
+def create_celery_app(include: list[str] = None) -> Celery:
+    host = env_settings.REDIS_HOST
+    port = env_settings.REDIS_PORT
+    pwd = env_settings.REDIS_PWD
+    app = Celery(
+        "video-gen-tasks",
+        broker=f"redis://:{pwd}@{host}:{port}/0",
+        backend=f"redis://:{pwd}@{host}:{port}/0",
+        include=include,
+    )
+    app.conf.task_serializer = "json"
+    app.conf.result_expires = 86400  # 1 day in seconds
+    app.conf.task_track_started = True
+    app.conf.task_queues = [
+        Queue(name, routing_key=name)
+        for name in [*lane_queues(), app.conf.task_default_queue]
+    ]
+    app.conf.broker_transport_options = {
+        "queue_order_strategy": "common.lanes:WeightedCycle",
+    }
+    return app
+
+
+@lru_cache(1)
+def get_celery_client() -> Celery:
+    return create_celery_app()
+
+
+def img_to_video_task_name() -> str:
+    if env_settings.SVD_BATCH_SIZE > 1:
+        return IMG_TO_VIDEO_BATCH_TASK
+    return IMG_TO_VIDEO_TASK
@@ -16,14 +16,71 @@ class EnvironmentSetting(BaseSettings):
     REDIS_PORT: str
     REDIS_PWD: str
 
+    # priority lanes as `lane:weight`, workers drain them in weighted order
+    SVD_LANES: str = "interactive:4,batch:1"
+    SVD_DEFAULT_LANE: str = "interactive"
+    # per API token lane as `token:lane`, other tokens use the default lane
+    SVD_TOKEN_LANES: str = ""
+
+    # admission control, 0 disables the limit
+    SVD_MAX_QUEUE_DEPTH: int = 0
+    SVD_MAX_WAIT_SECONDS: float = 0
+
+    # svd worker device, `auto` picks cuda when available, the launcher pins it
+    SVD_DEVICE: str = "auto"
+    SVD_WARMUP: bool = True
+    # `auto`, `resident`, `model_offload`, `sequential_offload` or `cpu`, auto
+    # keeps the weights resident when they fit next to the activation headroom
+    SVD_EXEC_PROFILE: str = "auto"
+    SVD_EXEC_HEADROOM_GB: float = 10.0
+    SVD_VAE_SLICING: bool = False
+    SVD_VAE_TILING: bool = False
+    SVD_CPU_THREADS: int = 0  # 0 keeps the torch default
+    # prometheus port of the first worker, the launcher gives the next ones
+    # consecutive ports; 0 disables the worker metrics server
+    SVD_WORKER_METRICS_PORT: int = 0
+
+    # number of img_to_video tasks the workers run at the same time
+    SVD_WORKER_SLOTS: int = 1
+
+    # img_to_video micro-batching, a batch size of 1 disables it
+    SVD_BATCH_SIZE: int = 1
+    SVD_BATCH_WAIT: float = 2.0  # seconds to wait for a batch to fill up
+
+    # content-addressed img2vid result cache
+    SVD_CACHE_TTL: int = 7 * 86400
+    SVD_CACHE_MAX_ENTRIES: int = 10000
+    SVD_INFLIGHT_TTL: int = 3600
+
+    # H.264 output encoding
+    VIDEO_CRF: int = 23
+    VIDEO_PRESET: str = "medium"
+
     # local data storage
     DATA_DIR: str
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    # worker-local LRU cache of task inputs fetched from object storage
+    SVD_INPUT_CACHE_BYTES: int = 5 * 1024**3
+    SVD_INPUT_CACHE_SWEEP_SECONDS: int = 300
+
+    # where inputs and generated videos are stored: `qiniu` or `local`
+    STORAGE_BACKEND: str = "qiniu"
+    # local backend, files are served by svd_service under /files
+    LOCAL_STORAGE_DIR: str = ""  # defaults to DATA_DIR/storage
+    LOCAL_STORAGE_URL: str = "http://127.0.0.1:27777/files"
 
     # qiniu cloud service video file storage
-    QINIU_AK: str
-    QINIU_SK: str
-    QINIU_BUCKET_NAME: str
-    QINIU_BUCKET_DOMAIN: str
+    QINIU_AK: str = ""
+    QINIU_SK: str = ""
+    QINIU_BUCKET_NAME: str = ""
+    QINIU_BUCKET_DOMAIN: str = ""
+    # empty resolves the upload host of the bucket's region
+    QINIU_UP_HOST: str = ""
+    QINIU_PART_SIZE: int = 4 * 1024 * 1024
+    QINIU_UPLOAD_CONCURRENCY: int = 4
+    QINIU_RETRIES: int = 3
+    QINIU_DOWNLOAD_TIMEOUT: float = 30.0
+    QINIU_DOWNLOAD_CONCURRENCY: int = 8
 
     class Config:
         env_file = ".env"
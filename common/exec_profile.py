@@ -0,0 +1,105 @@
+"""Where the weights of a diffusers pipeline live while it runs.
+
+- `resident`: every component stays on the GPU, fastest.
+- `model_offload`: components move to the GPU one at a time.
+- `sequential_offload`: submodules are streamed to the GPU layer by layer,
+  slowest but fits in a few GB.
+- `cpu`: no GPU at all.
+
+`auto` picks the fastest one whose weights plus `headroom_bytes` of
+activations fit in the free memory of the device.
+"""
+
+from typing import Optional
+
+import torch
+from loguru import logger
+
+PROFILES = ("resident", "model_offload", "sequential_offload", "cpu")
+
+
+def execution_device(requested: str, device: str = "auto") -> str:
+    """Device a pipeline runs on, known before the weights are loaded."""
+    if requested not in ("auto", *PROFILES):
+        raise ValueError(f"Unknown execution profile: {requested}")
+    if requested == "cpu":
+        return "cpu"
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def component_bytes(pipe) -> dict[str, int]:
+    """Size of the weights of every torch module of the pipeline."""
+    sizes = {}
+    for name, component in pipe.components.items():
+        if not isinstance(component, torch.nn.Module):
+            continue
+        tensors = [*component.parameters(), *component.buffers()]
+        sizes[name] = sum(t.numel() * t.element_size() for t in tensors)
+    return sizes
+
+
+def resolve_profile(
+    requested: str, pipe, device: str, headroom_bytes: int, name: str = "pipeline"
+) -> str:
+    device = execution_device(requested, device)
+    if torch.device(device).type != "cuda":
+        if requested not in ("auto", "cpu"):
+            logger.warning(f"{name}: {requested} needs a GPU, running on {device}")
+        return "cpu"
+
+    sizes = component_bytes(pipe)
+    total, largest = sum(sizes.values()), max(sizes.values(), default=0)
+    free, capacity = torch.cuda.mem_get_info(torch.device(device))
+    if requested != "auto":
+        profile = requested
+    elif total + headroom_bytes <= free:
+        profile = "resident"
+    elif largest + headroom_bytes <= free:
+        profile = "model_offload"
+    else:
+        profile = "sequential_offload"
+    logger.info(
+        f"{name}: {profile} profile ({requested}), weights {total / 2**30:.1f} GiB, "
+        f"largest component {largest / 2**30:.1f} GiB, "
+        f"{free / 2**30:.1f}/{capacity / 2**30:.1f} GiB free on {device}"
+    )
+    return profile
+
+
+def apply_profile(
+    pipe,
+    profile: str,
+    device: str,
+    vae_slicing: bool = False,
+    vae_tiling: bool = False,
+    cpu_threads: int = 0,
+):
+    if cpu_threads > 0:
+        torch.set_num_threads(cpu_threads)
+
+    gpu_id: Optional[int] = torch.device(device).index
+    if profile == "resident":
+        pipe.to(device)
+    elif profile == "model_offload":
+        pipe.enable_model_cpu_offload(gpu_id=gpu_id)
+    elif profile == "sequential_offload":
+        pipe.enable_sequential_cpu_offload(gpu_id=gpu_id)
+    elif profile == "cpu":
+        pipe.to("cpu")
+    else:
+        raise ValueError(f"Unknown execution profile: {profile}")
+
+    vae = getattr(pipe, "vae", None)
+    for enabled, method in (
+        (vae_slicing, "enable_slicing"),
+        (vae_tiling, "enable_tiling"),
+    ):
+        if not enabled:
+            continue
+        if hasattr(vae, method):
+            getattr(vae, method)()
+        else:
+            logger.warning(f"{type(vae).__name__} has no {method}, ignored")
+    return pipe
@@ -0,0 +1,90 @@
+"""Encode generated images in the format the client asked for.
+
+The format comes from an explicit request parameter or, failing that, the
+Accept header; PNG stays the default so existing clients see no change.
+AVIF is offered when Pillow can write it (Pillow >= 11.3 or the
+pillow-avif-plugin package).
+"""
+
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401, registers the AVIF plugin on older Pillow
+except ImportError:
+    pass
+
+DEFAULT_FORMAT = "png"
+# format -> (Pillow format, media type), in order of preference on a tie
+FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+ALIASES = {"jpg": "jpeg"}
+DEFAULT_QUALITY = {"avif": 75, "webp": 90, "jpeg": 90}
+
+Image.init()
+if "AVIF" not in Image.SAVE:
+    del FORMATS["avif"]
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def _parse_accept(accept: str) -> list[tuple[float, str]]:
+    ranges = []
+    for part in accept.split(","):
+        media, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media:
+            ranges.append((q, media.lower()))
+    return ranges
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Pick the output format, raise ValueError for an unsupported `requested`."""
+    if requested:
+        fmt = ALIASES.get(requested.lower(), requested.lower())
+        if fmt not in FORMATS:
+            raise ValueError(
+                f"Unsupported image format {requested}, use one of {', '.join(FORMATS)}"
+            )
+        return fmt
+    if not accept:
+        return DEFAULT_FORMAT
+
+    by_type = {media: fmt for fmt, (_, media) in FORMATS.items()}
+    preference = list(FORMATS)
+    candidates = [
+        (q, -preference.index(by_type[media]), by_type[media])
+        for q, media in _parse_accept(accept)
+        if media in by_type and q > 0
+    ]
+    # wildcards and unknown types keep the default
+    return max(candidates)[2] if candidates else DEFAULT_FORMAT
+
+
+def encode_image(image: Image.Image, fmt: str, quality: Optional[int] = None) -> bytes:
+    """Encode `image`, blocking; run it off the event loop."""
+    pil_format = FORMATS[fmt][0]
+    params = {}
+    if fmt in DEFAULT_QUALITY:
+        params["quality"] = quality or DEFAULT_QUALITY[fmt]
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format=pil_format, **params)
+    # BytesIO hands over its buffer without copying when nothing else holds it
+    return buffer.getvalue()
@@ -0,0 +1,78 @@
+from collections import defaultdict
+
+from common.config import env_settings
+
+
+def _parse_pairs(value: str) -> dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        if ":" in item:
+            k, v = item.rsplit(":", 1)
+            pairs[k.strip()] = v.strip()
+    return pairs
+
+
+LANE_WEIGHTS = {
+    lane: max(int(weight), 1)
+    for lane, weight in _parse_pairs(env_settings.SVD_LANES).items()
+}
+TOKEN_LANES = _parse_pairs(env_settings.SVD_TOKEN_LANES)
+
+
+def lane_queue(lane: str) -> str:
+    return f"svd_{lane}"
+
+
+def lane_queues() -> list[str]:
+    return [lane_queue(lane) for lane in LANE_WEIGHTS]
+
+
+def lane_for_token(token: str) -> str:
+    lane = TOKEN_LANES.get(token, env_settings.SVD_DEFAULT_LANE)
+    return lane if lane in LANE_WEIGHTS else env_settings.SVD_DEFAULT_LANE
+
+
+class WeightedCycle:
+    """Smooth weighted round robin over the worker's broker queues.
+
+    Plugged into kombu's redis transport as `queue_order_strategy`: the
+    transport asks `consume` for the order to BRPOP queues in and reports
+    the queue it got a message from via `rotate`. Lanes found empty are
+    skipped without banking credit, so an idle lane never starves the
+    others once it gets busy again.
+    """
+
+    def __init__(self, it=None):
+        self.items = it if it is not None else []
+        self.weights = {lane_queue(lane): w for lane, w in LANE_WEIGHTS.items()}
+        self.credits = defaultdict(int)
+        self._last_order = []
+
+    def _weight(self, queue: str) -> int:
+        return self.weights.get(queue, 1)
+
+    def update(self, it):
+        self.items[:] = it
+
+    def consume(self, n: int):
+        order = sorted(
+            self.items,
+            key=lambda queue: self.credits[queue] + self._weight(queue),
+            reverse=True,
+        )
+        self._last_order = order[:n]
+        return self._last_order
+
+    def rotate(self, last_used):
+        if last_used not in self.items:
+            return last_used
+        # queues polled before `last_used` were empty, they must not bank credit
+        order = self._last_order
+        skipped = set(order[: order.index(last_used)]) if last_used in order else set()
+        active = [queue for queue in self.items if queue not in skipped]
+        for queue in skipped:
+            self.credits[queue] = 0
+        for queue in active:
+            self.credits[queue] += self._weight(queue)
+        self.credits[last_used] -= sum(self._weight(queue) for queue in active)
+        return last_used
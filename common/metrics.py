@@ -0,0 +1,162 @@
+"""Prometheus instrumentation shared by every FastAPI service of the repo.
+
+Only depends on prometheus_client and starlette so services with their own
+config (voice-server, audio-verse, vocal-glass, sd35_lg) can import it; they
+need the repo root on PYTHONPATH.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+
+from fastapi import FastAPI
+from loguru import logger
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INFERENCE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+    buckets=HTTP_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being served.",
+    ["method", "route"],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Open WebSocket connections.",
+    ["route"],
+)
+INFERENCE_SECONDS = Histogram(
+    "model_inference_seconds",
+    "Wall time of one model inference.",
+    ["model"],
+    buckets=INFERENCE_BUCKETS,
+)
+TTS_REAL_TIME_FACTOR = Histogram(
+    "tts_real_time_factor",
+    "Generation time divided by the duration of the generated audio.",
+    ["model"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5),
+)
+QUEUE_DEPTH = Gauge(
+    "queue_depth",
+    "Tasks waiting in a queue.",
+    ["queue"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups",
+    "Cache lookups by result: hit, disk (spilled entry) or miss.",
+    ["cache", "result"],
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _route_template(scope) -> str:
+    # label by template, raw paths with ids would explode the series count
+    app = scope.get("app")
+    routes = getattr(getattr(app, "router", None), "routes", ())
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, it leaves response bodies untouched."""
+
+    def __init__(self, app, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            gauge = WEBSOCKET_CONNECTIONS.labels(_route_template(scope))
+            gauge.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                gauge.dec()
+            return
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = _route_template(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+def instrument(app: FastAPI, on_scrape: Optional[Callable[[], Awaitable[None]]] = None):
+    """Add the middleware and a `/metrics` endpoint to `app`.
+
+    The endpoint is a plain starlette route, so it skips app-wide
+    dependencies such as token auth. `on_scrape` refreshes gauges that are
+    cheaper to read on demand, like queue lengths.
+    """
+    app.add_middleware(MetricsMiddleware)
+
+    async def metrics(request: Request) -> Response:
+        if on_scrape is not None:
+            try:
+                await on_scrape()
+            except Exception as e:
+                logger.warning(f"Failed to refresh metrics: {e}")
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    app.add_route("/metrics", metrics, include_in_schema=False)
+
+
+@contextmanager
+def track_inference(model: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        INFERENCE_SECONDS.labels(model).observe(time.perf_counter() - start)
+
+
+def observe_tts(model: str, generation_seconds: float, audio_seconds: float):
+    INFERENCE_SECONDS.labels(model).observe(generation_seconds)
+    if audio_seconds > 0:
+        TTS_REAL_TIME_FACTOR.labels(model).observe(generation_seconds / audio_seconds)
+
+
+def start_metrics_server(port: int):
+    """Serve `/metrics` from a background thread, for processes without an app."""
+    start_http_server(port)
+    logger.info(f"Metrics served on port {port}")
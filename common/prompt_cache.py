@@ -0,0 +1,213 @@
+"""Cache of SD3 prompt embeddings.
+
+Encoding a prompt runs CLIP-L, CLIP-G and T5-XXL; reusing the embeddings of
+a prompt seen before skips all three. Entries live on the CPU in an LRU
+bounded by bytes, evicted ones spill to `spill_dir` when set, itself
+capped at `spill_max_bytes`.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import torch
+from loguru import logger
+
+from common.metrics import CACHE_LOOKUPS
+
+# (prompt_embeds, pooled_prompt_embeds) of a single prompt
+Embeds = tuple[torch.Tensor, torch.Tensor]
+
+
+def prompt_key(prompt: str, max_sequence_length: int) -> str:
+    # CLIP lowercases but T5 does not, so only whitespace is normalized
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{max_sequence_length}:{normalized}".encode()).hexdigest()
+
+
+def _nbytes(embeds: Embeds) -> int:
+    return sum(t.numel() * t.element_size() for t in embeds)
+
+
+class PromptCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        spill_dir: str = "",
+        spill_max_bytes: int = 0,
+        name: str = "prompt",
+    ):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.name = name
+        self.hits = self.misses = 0
+        self._entries: OrderedDict[str, Embeds] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.pt")
+
+    def _spill(self, key: str, embeds: Embeds):
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.spill_dir, prefix=".spill-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                torch.save(embeds, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._sweep_spilled()
+
+    def _sweep_spilled(self):
+        entries = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.is_file() and entry.name.endswith(".pt"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.spill_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _load_spilled(self, key: str) -> Optional[Embeds]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            embeds = torch.load(path, map_location="cpu", weights_only=True)
+            os.utime(path)
+            return embeds
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable spilled prompt embeds {path}: {e}")
+            os.remove(path)
+            return None
+
+    def _put(self, key: str, embeds: Embeds):
+        if key in self._entries:
+            return
+        self._entries[key] = embeds
+        self._bytes += _nbytes(embeds)
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old = self._entries.popitem(last=False)
+            self._bytes -= _nbytes(old)
+            if self.spill_dir:
+                try:
+                    self._spill(old_key, old)
+                except OSError as e:
+                    logger.warning(f"Failed to spill prompt embeds: {e}")
+
+    def get_many(
+        self,
+        prompts: list[str],
+        max_sequence_length: int,
+        encode: Callable[[list[str]], list[Embeds]],
+    ) -> list[Embeds]:
+        """Embeddings of every prompt, encoding the misses in one `encode` call."""
+        keys = [prompt_key(prompt, max_sequence_length) for prompt in prompts]
+        found: dict[str, Embeds] = {}
+        missing: dict[str, str] = {}
+        with self._lock:
+            for key, prompt in zip(keys, prompts):
+                if key in found or key in missing:
+                    continue
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                    result = "hit"
+                elif (embeds := self._load_spilled(key)) is not None:
+                    self._put(key, embeds)
+                    found[key] = embeds
+                    result = "disk"
+                else:
+                    missing[key] = prompt
+                    result = "miss"
+                CACHE_LOOKUPS.labels(self.name, result).inc()
+                if result == "miss":
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+        if missing:
+            encoded = encode(list(missing.values()))
+            with self._lock:
+                for key, embeds in zip(missing, encoded):
+                    # copy, a slice would keep the whole batch alive
+                    embeds = tuple(t.detach().to("cpu", copy=True) for t in embeds)
+                    self._put(key, embeds)
+                    found[key] = embeds
+        return [found[key] for key in keys]
+
+
+def sd3_prompt_kwargs(
+    pipe,
+    cache: PromptCache,
+    prompts: list[str],
+    max_sequence_length: int,
+    guidance_scale: float,
+) -> dict:
+    """Pipeline kwargs passing cached embeddings instead of the prompts.
+
+    The empty negative prompt the pipeline would encode for guidance is
+    cached like any other prompt.
+    """
+
+    def encode(texts: list[str]) -> list[Embeds]:
+        prompt_embeds, _, pooled, _ = pipe.encode_prompt(
+            prompt=texts,
+            prompt_2=None,
+            prompt_3=None,
+            do_classifier_free_guidance=False,
+            max_sequence_length=max_sequence_length,
+        )
+        return [
+            (prompt_embeds[i : i + 1], pooled[i : i + 1]) for i in range(len(texts))
+        ]
+
+    do_guidance = guidance_scale > 1
+    embeds = cache.get_many(
+        [*prompts, ""] if do_guidance else prompts, max_sequence_length, encode
+    )
+    device = pipe._execution_device
+    n = len(prompts)
+    kwargs = {
+        "prompt_embeds": torch.cat([e[0] for e in embeds[:n]]).to(device),
+        "pooled_prompt_embeds": torch.cat([e[1] for e in embeds[:n]]).to(device),
+    }
+    if do_guidance:
+        negative, negative_pooled = embeds[-1]
+        kwargs["negative_prompt_embeds"] = negative.expand(n, -1, -1).to(device)
+        kwargs["negative_pooled_prompt_embeds"] = negative_pooled.expand(n, -1).to(
+            device
+        )
+    return kwargs
@@ -1,60 +1,261 @@
+import asyncio
+import mimetypes
 import os
 import shutil
-from functools import lru_cache
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Union
 
+import aiohttp
 import requests
 from loguru import logger
-from qiniu import Auth, BucketManager, put_file
+from qiniu import Auth, BucketManager, Region, urlsafe_base64_encode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from common.config import env_settings
+from common.storage import Storage
 
+# qiniu only accepts parts between 1MB and 1GB
+MIN_PART_SIZE = 1024 * 1024
+# used when the region of the bucket cannot be looked up
+DEFAULT_UP_HOST = "https://upload.qiniup.com"
 
-class QiNiuConnector:
 
-    def __init__(self):
-        self.q = Auth(env_settings.QINIU_AK, env_settings.QINIU_SK)
+class QiNiuConnector(Storage):
+
+    def __init__(
+        self,
+        ak: str,
+        sk: str,
+        bucket_name: str,
+        bucket_domain: str,
+        up_host: str = "",
+        fallback_up_host: str = DEFAULT_UP_HOST,
+        hosts_cache_dir: str = "",
+        part_size: int = 4 * 1024 * 1024,
+        upload_concurrency: int = 4,
+        download_concurrency: int = 8,
+        retries: int = 3,
+        timeout: float = 30.0,
+    ):
+        self.q = Auth(ak, sk)
         self.bucket_manager = BucketManager(self.q)
-        self.bucket_name = env_settings.QINIU_BUCKET_NAME
-        self.bucket_domain = env_settings.QINIU_BUCKET_DOMAIN
+        self.bucket_name = bucket_name
+        self.bucket_domain = bucket_domain
+        # an explicit host overrides the one resolved for the bucket's region
+        self.up_host = up_host.rstrip("/")
+        self.fallback_up_host = fallback_up_host.rstrip("/")
+        # the SDK caches region lookups in a file, the cwd may be read-only
+        self.hosts_cache_dir = hosts_cache_dir or tempfile.gettempdir()
+        self._up_host_lock = threading.Lock()
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.timeout = timeout
+        self.download_concurrency = download_concurrency
+        self.http = self._build_http_session(
+            retries, max(upload_concurrency, download_concurrency)
+        )
+        self.upload_pool = ThreadPoolExecutor(
+            max_workers=upload_concurrency,
+            thread_name_prefix="qiniu-upload",
+        )
+        # created lazily, they must belong to the running event loop
+        self._session: aiohttp.ClientSession = None
+        self._download_slots: asyncio.Semaphore = None
+
+    def _build_http_session(self, retries: int, pool_size: int) -> requests.Session:
+        # keep-alive pool shared by every call, GET and part PUTs are retried
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
     def get_public_url(self, file_key: str):
+        if "://" in self.bucket_domain:
+            return "%s/%s" % (self.bucket_domain.rstrip("/"), file_key)
         return "https://%s/%s" % (self.bucket_domain, file_key)
 
     def _get_private_url(self, file_key: str):
         base_url = self.get_public_url(file_key)
         return self.q.private_download_url(base_url)
 
-    def upload_file(self, local_file_path: str, upload_dir: str):
-        file = os.path.basename(local_file_path)
-        upload_key = f"{upload_dir}/{file}"
+    def put_file(self, local_file_path: str, upload_key: str) -> str:
+        size = os.path.getsize(local_file_path)
+        if size <= self.part_size:
+            with open(local_file_path, "rb") as f:
+                return self._form_upload(f.read(), upload_key)
+
+        fd = os.open(local_file_path, os.O_RDONLY)
+        try:
+            # pread is positional, so the part threads can share one descriptor
+            return self._multipart_upload(
+                upload_key, size, lambda offset, n: os.pread(fd, n, offset)
+            )
+        finally:
+            os.close(fd)
+
+    def put_bytes(self, data: Union[bytes, memoryview], upload_key: str) -> str:
+        """Upload an in-memory buffer, parts are zero-copy slices of it."""
+        view = memoryview(data)
+        if view.nbytes <= self.part_size:
+            return self._form_upload(view, upload_key)
+        return self._multipart_upload(
+            upload_key, view.nbytes, lambda offset, n: view[offset : offset + n]
+        )
+
+    def put_fileobj(self, fileobj: BinaryIO, upload_key: str) -> str:
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+        if size <= self.part_size:
+            return self._form_upload(fileobj.read(), upload_key)
+
+        lock = threading.Lock()
+
+        def read_part(offset: int, n: int) -> bytes:
+            # file objects have a single position, part threads take turns
+            with lock:
+                fileobj.seek(offset)
+                return fileobj.read(n)
+
+        return self._multipart_upload(upload_key, size, read_part)
+
+    def _get_up_host(self, token: str) -> str:
+        """Upload host of the bucket's region, looked up once per connector.
+
+        A failed lookup falls back to `fallback_up_host` and is retried on
+        the next upload.
+        """
+        if not self.up_host:
+            with self._up_host_lock:
+                if not self.up_host:
+                    region = Region(scheme="https", home_dir=self.hosts_cache_dir)
+                    try:
+                        host = region.get_up_host_by_token(token, self.hosts_cache_dir)
+                    except Exception as e:
+                        logger.warning(
+                            f"Failed to look up the upload host of "
+                            f"{self.bucket_name}, using {self.fallback_up_host}: {e}"
+                        )
+                        return self.fallback_up_host
+                    self.up_host = host.rstrip("/")
+                    logger.info(f"Uploading to {self.bucket_name} via {self.up_host}")
+        return self.up_host
+
+    def _form_upload(self, data, upload_key: str) -> str:
         token = self.q.upload_token(self.bucket_name, upload_key)
-        res, info = put_file(token, upload_key, local_file_path, version="v2")
+        resp = self.http.post(
+            self._get_up_host(token),
+            data={"token": token, "key": upload_key},
+            files={"file": (os.path.basename(upload_key), data)},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return upload_key
+
+    def _multipart_upload(
+        self,
+        upload_key: str,
+        size: int,
+        read_part: Callable[[int, int], Union[bytes, memoryview]],
+    ) -> str:
+        """Resumable upload v2, parts are sent concurrently."""
+        token = self.q.upload_token(self.bucket_name, upload_key)
+        headers = {"Authorization": f"UpToken {token}"}
+        base_url = "%s/buckets/%s/objects/%s/uploads" % (
+            self._get_up_host(token),
+            self.bucket_name,
+            urlsafe_base64_encode(upload_key),
+        )
+        resp = self.http.post(base_url, headers=headers, timeout=self.timeout)
+        resp.raise_for_status()
+        upload_url = f"{base_url}/{resp.json()['uploadId']}"
+
+        def put_part(part_number: int, offset: int) -> dict:
+            data = read_part(offset, min(self.part_size, size - offset))
+            resp = self.http.put(
+                f"{upload_url}/{part_number}",
+                data=data,
+                headers={**headers, "Content-Type": "application/octet-stream"},
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            return {"partNumber": part_number, "etag": resp.json()["etag"]}
+
+        offsets = range(0, size, self.part_size)
+        futures = [
+            self.upload_pool.submit(put_part, i + 1, offset)
+            for i, offset in enumerate(offsets)
+        ]
+        try:
+            parts = [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            try:
+                self.http.delete(upload_url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Failed to abort upload of {upload_key}: {e}")
+            raise
+
+        mime_type = mimetypes.guess_type(upload_key)[0] or "application/octet-stream"
+        resp = self.http.post(
+            upload_url,
+            json={
+                "parts": parts,
+                "fname": os.path.basename(upload_key),
+                "mimeType": mime_type,
+            },
+            headers=headers,
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
         return upload_key
 
     def download_file(self, file_key: str, output_dir: str) -> str:
         url = self._get_private_url(file_key)
-        resp = requests.get(url, stream=True)
         filename = os.path.basename(file_key)
         output_path = os.path.join(output_dir, filename)
         try:
-            resp.raise_for_status()
-            with open(output_path, "wb") as file:
-                # Use shutil.copyfileobj to copy the response stream to the file
-                shutil.copyfileobj(resp.raw, file)
+            with self.http.get(url, stream=True, timeout=self.timeout) as resp:
+                resp.raise_for_status()
+                with open(output_path, "wb") as file:
+                    # Use shutil.copyfileobj to copy the response stream to the file
+                    shutil.copyfileobj(resp.raw, file)
             return output_path
         except Exception as e:
             logger.error(f"error: {e}")
             return ""
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.download_concurrency),
+            )
+            self._download_slots = asyncio.Semaphore(self.download_concurrency)
+        return self._session
 
-@lru_cache(1)
-def get_qiniu():
-    qiniu = QiNiuConnector()
-    return qiniu
-
+    async def aiter_file(
+        self, file_key: str, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[bytes]:
+        """Stream an object without blocking the event loop."""
+        session = self._get_session()
+        url = self._get_private_url(file_key)
+        async with self._download_slots:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    yield chunk
 
-if __name__ == "__main__":
-    q = get_qiniu()
-    img_key = "svd_materials/still_frames/1783379873989922816.png"
-    output_path = q.download_file(img_key, ".")
-    print(output_path)
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,76 @@
+import time
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+
+RUNNING_KEY = "svd:stats:running"
+DURATIONS_KEY = "svd:stats:durations"
+DURATION_WINDOW = 100
+# running entries older than this belong to a worker that died mid-task
+STALE_RUNNING_SECONDS = 6 * 3600
+
+
+def mark_started(conn: redis.Redis, task_ids: list[str]):
+    if not task_ids:
+        return
+    now = time.time()
+    try:
+        conn.zadd(RUNNING_KEY, {task_id: now for task_id in task_ids})
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record task start: {e}")
+
+
+def mark_finished(conn: redis.Redis, task_ids: list[str], duration: float):
+    """Record the end of a run, `duration` is the wall time of the whole run.
+
+    A batched run finishes several tasks at once, so the rolling average
+    tracks the effective time per task.
+    """
+    if not task_ids:
+        return
+    try:
+        pipe = conn.pipeline(transaction=False)
+        pipe.zrem(RUNNING_KEY, *task_ids)
+        pipe.lpush(DURATIONS_KEY, *[duration / len(task_ids)] * len(task_ids))
+        pipe.ltrim(DURATIONS_KEY, 0, DURATION_WINDOW - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record task end: {e}")
+
+
+async def get_queue_stats(
+    conn: aioredis.Redis, queues: list[str], worker_slots: int
+) -> dict:
+    now = time.time()
+    pipe = conn.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    pipe.zremrangebyscore(RUNNING_KEY, 0, now - STALE_RUNNING_SECONDS)
+    pipe.zrange(RUNNING_KEY, 0, -1, withscores=True)
+    pipe.lrange(DURATIONS_KEY, 0, -1)
+    *lengths, _, running, durations = await pipe.execute()
+
+    queued = dict(zip(queues, lengths))
+    durations = [float(d) for d in durations]
+    avg_duration = sum(durations) / len(durations) if durations else None
+
+    predicted_wait = None
+    if avg_duration is not None:
+        # what is left of the running tasks plus everything queued before us
+        remaining = sum(
+            max(avg_duration - (now - started), 0) for _, started in running
+        )
+        backlog = remaining + sum(lengths) * avg_duration
+        predicted_wait = backlog / max(worker_slots, 1)
+
+    return {
+        "queued": queued,
+        "queued_total": sum(lengths),
+        "running": len(running),
+        "worker_slots": worker_slots,
+        "avg_task_seconds": round(avg_duration, 2) if avg_duration else None,
+        "predicted_wait_seconds": (
+            round(predicted_wait, 1) if predicted_wait is not None else None
+        ),
+    }
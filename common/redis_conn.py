@@ -1,10 +1,13 @@
+from functools import lru_cache
+
 import redis
+import redis.asyncio as aioredis
 
 from common.config import env_settings
 
 
-def get_redis_conn():
-    pool = redis.ConnectionPool(
+def _conn_kwargs() -> dict:
+    return dict(
         host=env_settings.REDIS_HOST,
         port=env_settings.REDIS_PORT,
         db=0,
@@ -13,4 +16,17 @@ def get_redis_conn():
         password=env_settings.REDIS_PWD,
         decode_responses=True,
     )
+
+
+@lru_cache(1)
+def get_redis_conn() -> redis.Redis:
+    """Process-wide client, every caller shares the same connection pool."""
+    pool = redis.ConnectionPool(**_conn_kwargs())
     return redis.Redis(connection_pool=pool)
+
+
+@lru_cache(1)
+def get_async_redis_conn() -> aioredis.Redis:
+    """Process-wide asyncio client, use it from a single event loop."""
+    pool = aioredis.ConnectionPool(**_conn_kwargs())
+    return aioredis.Redis(connection_pool=pool)
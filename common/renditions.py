@@ -0,0 +1,26 @@
+from typing import Callable
+
+# rendition name -> suffix of its output file, all of them come out of a
+# single ffmpeg run over the generated frames
+RENDITIONS = {
+    "mp4": ".mp4",
+    "webm": ".webm",
+    "poster": ".jpg",
+    "boomerang": "-boomerang.mp4",
+}
+DEFAULT_RENDITIONS = ("mp4",)
+
+
+def parse_renditions(value: str) -> list[str]:
+    """Validate a comma separated list of renditions, in canonical order."""
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - RENDITIONS.keys()
+    if unknown:
+        raise ValueError(f"Unknown renditions: {', '.join(sorted(unknown))}")
+    return [name for name in RENDITIONS if name in names] or list(DEFAULT_RENDITIONS)
+
+
+def rendition_urls(keys: dict[str, str], get_url: Callable[[str], str]) -> dict:
+    urls = {name: get_url(key) for name, key in keys.items()}
+    # `url` stays for clients that predate renditions
+    return {"url": urls.get("mp4") or next(iter(urls.values())), "urls": urls}
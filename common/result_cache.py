@@ -0,0 +1,188 @@
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+
+from common.config import env_settings
+from common.redis_conn import get_async_redis_conn, get_redis_conn
+
+CACHE_KEY = "svd:cache:{}"
+CACHE_INDEX_KEY = "svd:cache:index"
+INFLIGHT_KEY = "svd:inflight:{}"
+HITS_KEY = "svd:cache:hits"
+MISSES_KEY = "svd:cache:misses"
+
+# delete an in-flight claim only while it still belongs to the caller
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_digest: str, params: dict) -> str:
+    """Key a generation by the input image content and its parameters."""
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(f"{image_digest}:{payload}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed index of generated videos and in-flight tasks.
+
+    Entries expire `ttl` seconds after their last hit; beyond `max_entries` the least
+    recently hit entries are evicted first. The `a*` methods used by the API
+    go through `aconn` so they never block the event loop.
+    """
+
+    def __init__(
+        self,
+        conn: redis.Redis,
+        ttl: int,
+        max_entries: int,
+        inflight_ttl: int,
+        aconn: Optional[aioredis.Redis] = None,
+    ):
+        self.conn = conn
+        self.aconn = aconn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.inflight_ttl = inflight_ttl
+        self._release = conn.register_script(RELEASE_SCRIPT)
+        self._arelease = aconn.register_script(RELEASE_SCRIPT) if aconn else None
+
+    def _count_lookup(self, pipe, cache_key: str, value: Optional[str]):
+        if value:
+            pipe.incr(HITS_KEY)
+            # sliding TTL: the index score and the key expire together
+            pipe.zadd(CACHE_INDEX_KEY, {cache_key: time.time()}, xx=True)
+            pipe.expire(CACHE_KEY.format(cache_key), self.ttl)
+        else:
+            pipe.incr(MISSES_KEY)
+
+    def lookup(self, cache_key: str) -> Optional[dict[str, str]]:
+        """Object keys of a finished generation by rendition name."""
+        value = self.conn.get(CACHE_KEY.format(cache_key))
+        pipe = self.conn.pipeline(transaction=False)
+        self._count_lookup(pipe, cache_key, value)
+        pipe.execute()
+        return _decode_keys(value)
+
+    async def alookup(self, cache_key: str) -> Optional[dict[str, str]]:
+        value = await self.aconn.get(CACHE_KEY.format(cache_key))
+        pipe = self.aconn.pipeline(transaction=False)
+        self._count_lookup(pipe, cache_key, value)
+        await pipe.execute()
+        return _decode_keys(value)
+
+    def claim(self, cache_key: str, task_id: str) -> Optional[str]:
+        """Register `task_id` as producing `cache_key`.
+
+        Returns the id of the task already producing it, if there is one.
+        """
+        key = INFLIGHT_KEY.format(cache_key)
+        if self.conn.set(key, task_id, nx=True, ex=self.inflight_ttl):
+            return None
+        existing = self.conn.get(key)
+        if existing is None:
+            # the other task finished in between, retry the claim once
+            if self.conn.set(key, task_id, nx=True, ex=self.inflight_ttl):
+                return None
+            existing = self.conn.get(key)
+        return existing
+
+    def release(self, cache_key: str, task_id: str):
+        """Drop the claim of `task_id`, unless it expired and was re-claimed."""
+        self._release(keys=[INFLIGHT_KEY.format(cache_key)], args=[task_id])
+
+    async def aclaim(self, cache_key: str, task_id: str) -> Optional[str]:
+        key = INFLIGHT_KEY.format(cache_key)
+        for _ in range(2):
+            if await self.aconn.set(key, task_id, nx=True, ex=self.inflight_ttl):
+                return None
+            existing = await self.aconn.get(key)
+            if existing is not None:
+                return existing
+        # the other task finished in between twice, let this one run too
+        return None
+
+    async def arelease(self, cache_key: str, task_id: str):
+        await self._arelease(keys=[INFLIGHT_KEY.format(cache_key)], args=[task_id])
+
+    def store(self, cache_key: str, keys: dict[str, str]):
+        now = time.time()
+        pipe = self.conn.pipeline(transaction=False)
+        pipe.set(CACHE_KEY.format(cache_key), json.dumps(keys), ex=self.ttl)
+        pipe.zadd(CACHE_INDEX_KEY, {cache_key: now})
+        pipe.zremrangebyscore(CACHE_INDEX_KEY, 0, now - self.ttl)
+        pipe.zcard(CACHE_INDEX_KEY)
+        size = pipe.execute()[-1]
+        overflow = size - self.max_entries
+        if overflow > 0:
+            self._evict(overflow)
+
+    def _evict(self, count: int):
+        victims = self.conn.zrange(CACHE_INDEX_KEY, 0, count - 1)
+        if not victims:
+            return
+        pipe = self.conn.pipeline(transaction=False)
+        pipe.delete(*[CACHE_KEY.format(victim) for victim in victims])
+        pipe.zrem(CACHE_INDEX_KEY, *victims)
+        pipe.execute()
+        logger.info(f"Evicted {len(victims)} img2vid cache entries")
+
+    def _stats(self, hits, misses, size) -> dict:
+        hits, misses = int(hits or 0), int(misses or 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": size,
+            "max_entries": self.max_entries,
+        }
+
+    def stats(self) -> dict:
+        pipe = self.conn.pipeline(transaction=False)
+        pipe.get(HITS_KEY)
+        pipe.get(MISSES_KEY)
+        pipe.zcard(CACHE_INDEX_KEY)
+        return self._stats(*pipe.execute())
+
+    async def astats(self) -> dict:
+        pipe = self.aconn.pipeline(transaction=False)
+        pipe.get(HITS_KEY)
+        pipe.get(MISSES_KEY)
+        pipe.zcard(CACHE_INDEX_KEY)
+        return self._stats(*await pipe.execute())
+
+
+def _decode_keys(value: Optional[str]) -> Optional[dict[str, str]]:
+    if not value:
+        return None
+    # entries written before renditions hold the bare mp4 key
+    return json.loads(value) if value.startswith("{") else {"mp4": value}
+
+
+@lru_cache(1)
+def get_result_cache() -> ResultCache:
+    return ResultCache(
+        get_redis_conn(),
+        ttl=env_settings.SVD_CACHE_TTL,
+        max_entries=env_settings.SVD_CACHE_MAX_ENTRIES,
+        inflight_ttl=env_settings.SVD_INFLIGHT_TTL,
+        aconn=get_async_redis_conn(),
+    )
@@ -0,0 +1,308 @@
+"""Object storage used for task inputs and generated media.
+
+`Storage` is what services program against, `QiNiuConnector` and
+`LocalStorage` implement it. Only `get_storage` reads common.config, so the
+backends can be built from any service's own settings.
+"""
+
+import asyncio
+import mimetypes
+import os
+import shutil
+import stat as stat_mode
+import tempfile
+from abc import ABC, abstractmethod
+from email.utils import formatdate
+from functools import lru_cache
+from typing import AsyncIterator, BinaryIO, Optional, Union
+from urllib.parse import quote, unquote
+
+from loguru import logger
+
+
+class Storage(ABC):
+    @abstractmethod
+    def get_public_url(self, file_key: str) -> str: ...
+
+    @abstractmethod
+    def put_file(self, local_file_path: str, upload_key: str) -> str:
+        """Store a local file under `upload_key` and return the key."""
+
+    @abstractmethod
+    def put_bytes(self, data: Union[bytes, memoryview], upload_key: str) -> str: ...
+
+    @abstractmethod
+    def put_fileobj(self, fileobj: BinaryIO, upload_key: str) -> str:
+        """Store the content of a seekable binary file object."""
+
+    @abstractmethod
+    def download_file(self, file_key: str, output_dir: str) -> str:
+        """Copy an object into `output_dir`, return its path or "" on failure."""
+
+    @abstractmethod
+    def aiter_file(
+        self, file_key: str, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[bytes]: ...
+
+    def upload_file(self, local_file_path: str, upload_dir: str) -> str:
+        file = os.path.basename(local_file_path)
+        return self.put_file(local_file_path, f"{upload_dir}/{file}")
+
+    async def aupload_file(self, local_file_path: str, upload_dir: str) -> str:
+        return await asyncio.to_thread(self.upload_file, local_file_path, upload_dir)
+
+    async def aput_file(self, local_file_path: str, upload_key: str) -> str:
+        return await asyncio.to_thread(self.put_file, local_file_path, upload_key)
+
+    async def aput_bytes(self, data: Union[bytes, memoryview], upload_key: str) -> str:
+        return await asyncio.to_thread(self.put_bytes, data, upload_key)
+
+    async def aput_fileobj(self, fileobj: BinaryIO, upload_key: str) -> str:
+        return await asyncio.to_thread(self.put_fileobj, fileobj, upload_key)
+
+    async def adownload_file(self, file_key: str, output_dir: str) -> str:
+        return await asyncio.to_thread(self.download_file, file_key, output_dir)
+
+    async def aclose(self):
+        pass
+
+
+class LocalStorage(Storage):
+    """Objects are files under `root`, served by `asgi_app` at `base_url`."""
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.realpath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def local_path(self, file_key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, file_key.lstrip("/")))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid file key: {file_key}")
+        return path
+
+    def get_public_url(self, file_key: str) -> str:
+        return f"{self.base_url}/{quote(file_key)}"
+
+    def _atomic_write(self, upload_key: str, write):
+        path = self.local_path(upload_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".put-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return upload_key
+
+    def put_file(self, local_file_path: str, upload_key: str) -> str:
+        def write(f):
+            with open(local_file_path, "rb") as src:
+                # copyfileobj between regular files goes through sendfile on linux
+                shutil.copyfileobj(src, f)
+
+        return self._atomic_write(upload_key, write)
+
+    def put_bytes(self, data: Union[bytes, memoryview], upload_key: str) -> str:
+        return self._atomic_write(upload_key, lambda f: f.write(data))
+
+    def put_fileobj(self, fileobj: BinaryIO, upload_key: str) -> str:
+        fileobj.seek(0)
+        return self._atomic_write(upload_key, lambda f: shutil.copyfileobj(fileobj, f))
+
+    def download_file(self, file_key: str, output_dir: str) -> str:
+        output_path = os.path.join(output_dir, os.path.basename(file_key))
+        try:
+            shutil.copyfile(self.local_path(file_key), output_path)
+            return output_path
+        except (OSError, ValueError) as e:
+            logger.error(f"error: {e}")
+            return ""
+
+    async def aiter_file(
+        self, file_key: str, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.local_path(file_key), "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                yield chunk
+        finally:
+            f.close()
+
+    def asgi_app(self) -> "FileServer":
+        return FileServer(self)
+
+
+def parse_range(value: str, size: int) -> Optional[tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive offsets.
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges) and raises ValueError when the range is not satisfiable.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last):
+        return None
+    if not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # suffix range, the last `last` bytes
+        length = int(last)
+        if not length:
+            raise ValueError("range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileServer:
+    """ASGI app serving `LocalStorage` objects with HTTP range support.
+
+    Bodies go out through the `http.response.zerocopysend` extension when
+    the server offers it, otherwise in chunks read off the event loop.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, storage: LocalStorage):
+        self.storage = storage
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._send_empty(send, 405, [(b"allow", b"GET, HEAD")])
+            return
+
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+        try:
+            file_path = self.storage.local_path(unquote(path))
+            stat = await asyncio.to_thread(os.stat, file_path)
+        except (OSError, ValueError):
+            await self._send_empty(send, 404)
+            return
+        if not stat_mode.S_ISREG(stat.st_mode):
+            await self._send_empty(send, 404)
+            return
+
+        size = stat.st_size
+        start, end, status = 0, size - 1, 200
+        headers = dict(scope["headers"])
+        if b"range" in headers and size:
+            try:
+                parsed = parse_range(headers[b"range"].decode("latin-1"), size)
+            except ValueError:
+                await self._send_empty(
+                    send, 416, [(b"content-range", f"bytes */{size}".encode())]
+                )
+                return
+            if parsed is not None:
+                start, end = parsed
+                status = 206
+
+        count = end - start + 1 if size else 0
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        response_headers = [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(count).encode()),
+            (b"accept-ranges", b"bytes"),
+            (b"last-modified", formatdate(stat.st_mtime, usegmt=True).encode()),
+            (b"etag", f'"{int(stat.st_mtime)}-{size}"'.encode()),
+        ]
+        if status == 206:
+            response_headers.append(
+                (b"content-range", f"bytes {start}-{end}/{size}".encode())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": response_headers,
+            }
+        )
+        if scope["method"] == "HEAD" or not count:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with open(file_path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": start,
+                        "count": count,
+                    }
+                )
+                return
+            fd = f.fileno()
+            offset, remaining = start, count
+            while remaining:
+                n = min(self.chunk_size, remaining)
+                chunk = await asyncio.to_thread(os.pread, fd, n, offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": bool(remaining),
+                    }
+                )
+            if remaining:
+                # the file shrank under us, end the body instead of hanging
+                await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _send_empty(send, status: int, headers: list = None):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-length", b"0"), *(headers or [])],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+
+@lru_cache(1)
+def get_storage() -> Storage:
+    """Storage configured by STORAGE_BACKEND in common.config."""
+    from common.config import env_settings
+
+    backend = env_settings.STORAGE_BACKEND
+    if backend == "local":
+        root = env_settings.LOCAL_STORAGE_DIR or os.path.join(
+            env_settings.DATA_DIR, "storage"
+        )
+        return LocalStorage(root, env_settings.LOCAL_STORAGE_URL)
+    if backend == "qiniu":
+        from common.qiniu_conn import QiNiuConnector
+
+        return QiNiuConnector(
+            ak=env_settings.QINIU_AK,
+            sk=env_settings.QINIU_SK,
+            bucket_name=env_settings.QINIU_BUCKET_NAME,
+            bucket_domain=env_settings.QINIU_BUCKET_DOMAIN,
+            up_host=env_settings.QINIU_UP_HOST,
+            hosts_cache_dir=env_settings.DATA_DIR,
+            part_size=env_settings.QINIU_PART_SIZE,
+            upload_concurrency=env_settings.QINIU_UPLOAD_CONCURRENCY,
+            download_concurrency=env_settings.QINIU_DOWNLOAD_CONCURRENCY,
+            retries=env_settings.QINIU_RETRIES,
+            timeout=env_settings.QINIU_DOWNLOAD_TIMEOUT,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,30 @@
+from typing import NamedTuple
+
+
+class SvdPreset(NamedTuple):
+    width: int
+    height: int
+    num_frames: int
+    num_inference_steps: int
+    decode_chunk_size: int
+
+
+# draft is a cheap preview to iterate on, final is the full quality render;
+# sizes stay multiples of 64 so the unet never has to pad its feature maps
+PRESETS = {
+    "draft": SvdPreset(
+        width=576,
+        height=320,
+        num_frames=14,
+        num_inference_steps=10,
+        decode_chunk_size=14,
+    ),
+    "final": SvdPreset(
+        width=1024,
+        height=576,
+        num_frames=25,
+        num_inference_steps=25,
+        decode_chunk_size=8,
+    ),
+}
+DEFAULT_QUALITY = "final"
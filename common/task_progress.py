@@ -0,0 +1,69 @@
+import time
+from typing import Optional
+
+import redis
+from loguru import logger
+
+PROGRESS_KEY = "svd:progress:{}"
+PROGRESS_TTL = 3600
+
+# slice of the overall percentage each phase of img_to_video accounts for
+PHASES = {
+    "preprocess": (0, 5),
+    "denoise": (5, 80),
+    "decode": (80, 90),
+    "encode": (90, 95),
+    "upload": (95, 100),
+}
+
+
+class ProgressReporter:
+    """Publish img_to_video progress for one or more tasks sharing a run."""
+
+    def __init__(self, conn: redis.Redis, task_ids: list[str]):
+        self.conn = conn
+        self.task_ids = [task_id for task_id in task_ids if task_id]
+        self.started_at = time.time()
+
+    def update(self, phase: str, done: int = 0, total: int = 1):
+        if not self.task_ids:
+            return
+        lo, hi = PHASES[phase]
+        percent = lo + (hi - lo) * min(done, total) / max(total, 1)
+        mapping = {
+            "phase": phase,
+            "step": done,
+            "total_steps": total,
+            "percent": round(percent, 1),
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+        }
+        try:
+            pipe = self.conn.pipeline(transaction=False)
+            for task_id in self.task_ids:
+                key = PROGRESS_KEY.format(task_id)
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, PROGRESS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            # progress is best effort, never fail the task because of it
+            logger.warning(f"Failed to publish progress: {e}")
+
+
+def format_progress(data: dict) -> Optional[dict]:
+    """Turn a raw progress hash into a status payload with an ETA."""
+    if not data:
+        return None
+    percent = float(data["percent"])
+    elapsed = max(time.time() - float(data["started_at"]), 0.0)
+    eta = None
+    if percent > 0:
+        eta = round(elapsed * (100 - percent) / percent, 1)
+    return {
+        "phase": data["phase"],
+        "step": int(data["step"]),
+        "total_steps": int(data["total_steps"]),
+        "percent": percent,
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": eta,
+    }
@@ -0,0 +1,91 @@
+import json
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+import redis
+from loguru import logger
+
+TIMINGS_KEY = "svd:stats:timings"
+TIMINGS_WINDOW = 1000
+
+# in pipeline order, `total` is the wall time of the whole run
+STAGES = (
+    "download",
+    "preprocess",
+    "diffusion",
+    "vae_decode",
+    "encode",
+    "upload",
+    "total",
+)
+
+
+class StageTimer:
+    """Accumulate wall time per stage, a stage may be entered several times."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            name: round(self.seconds[name], 3)
+            for name in STAGES
+            if name in self.seconds
+        }
+
+
+def record_timings(conn: redis.Redis, entries: list[dict]):
+    """Keep the breakdown of recent tasks for `worker.timing_report`."""
+    if not entries:
+        return
+    try:
+        pipe = conn.pipeline(transaction=False)
+        pipe.lpush(TIMINGS_KEY, *[json.dumps(entry) for entry in entries])
+        pipe.ltrim(TIMINGS_KEY, 0, TIMINGS_WINDOW - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record task timings: {e}")
+
+
+def load_timings(conn: redis.Redis, limit: int = TIMINGS_WINDOW) -> list[dict]:
+    return [json.loads(entry) for entry in conn.lrange(TIMINGS_KEY, 0, limit - 1)]
+
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(entries: list[dict]) -> dict:
+    """p50/p95 per stage of the `timings` of each entry."""
+    per_stage = defaultdict(list)
+    for entry in entries:
+        for name, seconds in entry.get("timings", {}).items():
+            per_stage[name].append(seconds)
+    return {
+        name: {
+            "count": len(per_stage[name]),
+            "p50": percentile(per_stage[name], 50),
+            "p95": percentile(per_stage[name], 95),
+        }
+        for name in STAGES
+        if per_stage[name]
+    }
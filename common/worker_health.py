@@ -0,0 +1,64 @@
+import os
+import socket
+import threading
+import time
+from typing import Callable
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+
+HEARTBEAT_KEY = "svd:worker:heartbeat:{}"
+# ids of every worker that has published a heartbeat
+WORKERS_KEY = "svd:workers"
+HEARTBEAT_INTERVAL = 15
+# a worker missing two beats in a row is considered gone
+HEARTBEAT_TTL = HEARTBEAT_INTERVAL * 2 + 5
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def start_heartbeat(conn: redis.Redis, state: Callable[[], dict]) -> threading.Thread:
+    """Publish the pool process state to Redis from a daemon thread.
+
+    The API reads these instead of sending tasks, so probes never take the
+    worker's only slot.
+    """
+    wid = worker_id()
+    key = HEARTBEAT_KEY.format(wid)
+
+    def loop():
+        while True:
+            try:
+                pipe = conn.pipeline(transaction=False)
+                pipe.sadd(WORKERS_KEY, wid)
+                pipe.hset(key, mapping={**state(), "updated_at": time.time()})
+                pipe.expire(key, HEARTBEAT_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Failed to publish worker heartbeat: {e}")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    thread = threading.Thread(target=loop, name="worker-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+async def get_heartbeats(conn: aioredis.Redis) -> dict[str, dict]:
+    """State of every live worker, by worker id.
+
+    Ids whose heartbeat expired are dropped from the registry on the way.
+    """
+    ids = sorted(await conn.smembers(WORKERS_KEY))
+    if not ids:
+        return {}
+    pipe = conn.pipeline(transaction=False)
+    for wid in ids:
+        pipe.hgetall(HEARTBEAT_KEY.format(wid))
+    states = dict(zip(ids, await pipe.execute()))
+    gone = [wid for wid, state in states.items() if not state]
+    if gone:
+        await conn.srem(WORKERS_KEY, *gone)
+    return {wid: state for wid, state in states.items() if state}
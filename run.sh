@@ -28,8 +28,8 @@ start_service() {
     fi
 }
 
-# Start Celery worker
-start_service "Celery Worker" "celery -A worker.app worker --loglevel=info --concurrency=1" "/tmp/celery_log.txt"
+# Start Celery workers, one per visible GPU (a single CPU worker without GPUs)
+start_service "Celery Worker" "python -m worker.launch --loglevel=info" "/tmp/celery_log.txt"
 
 # Start SVD Service
 start_service "SVD Service" "python svd_service/app.py" "/tmp/svd_service_log.txt"
@@ -39,4 +39,4 @@ start_service "Flower" "celery -A worker.app flower --basic_auth=$FLOWER_USER:$F
 
 # Print running processes
 echo "All services started. Processes running:"
-ps aux | grep -E 'celery|svd_service|flower' | grep -v grep
+ps aux | grep -E 'celery|worker.launch|svd_service|flower' | grep -v grep
@@ -0,0 +1,165 @@
+"""Serialize GPU work behind a bounded queue and batch compatible requests.
+
+Requests with the same key (the pipeline parameters that must be shared
+within one call) are grouped into a single `run_batch(key, items)` call,
+run on a dedicated thread so the event loop keeps serving health checks
+and metrics while the GPU is busy.
+"""
+
+import asyncio
+import contextlib
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+from common.metrics import QUEUE_DEPTH
+from loguru import logger
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("The queue is full, please retry later.")
+        self.retry_after = retry_after
+
+
+class _Job(NamedTuple):
+    key: Hashable
+    item: Any
+    future: asyncio.Future
+
+
+class BatchExecutor:
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, list], list],
+        max_queue: int,
+        max_batch: int,
+        max_wait: float,
+        name: str = "gpu",
+    ):
+        self.run_batch = run_batch
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.running = 0
+        # moving average of one batch, for Retry-After
+        self.avg_batch_seconds: Optional[float] = None
+        self._queue: Optional[asyncio.Queue] = None
+        # jobs taken off the queue while collecting a batch of another key
+        self._deferred: deque[_Job] = deque()
+        # futures of jobs not running yet, cancelled ones leave on their own
+        self._waiting: set[asyncio.Future] = set()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix=name)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        # a running batch finishes on its thread, the loop keeps serving meanwhile
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+    @property
+    def depth(self) -> int:
+        """Jobs still waiting for the GPU, callers that went away excluded."""
+        return len(self._waiting)
+
+    def retry_after(self) -> int:
+        batches = math.ceil((self.depth + 1) / self.max_batch)
+        return max(math.ceil(batches * (self.avg_batch_seconds or 1.0)), 1)
+
+    def enqueue(self, key: Hashable, item: Any) -> asyncio.Future:
+        """Queue a job, cancelling the returned future drops it unless running."""
+        if self.depth >= self.max_queue:
+            raise QueueFullError(self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.add(future)
+        future.add_done_callback(self._waiting.discard)
+        self._queue.put_nowait(_Job(key, item, future))
+        QUEUE_DEPTH.labels(self.name).set(self.depth)
+        return future
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        return await self.enqueue(key, item)
+
+    async def _collect(self) -> list[_Job]:
+        loop = asyncio.get_running_loop()
+        first = None
+        while first is None or first.future.done():
+            if self._deferred:
+                first = self._deferred.popleft()
+            else:
+                first = await self._queue.get()
+        batch = [first]
+        for job in list(self._deferred):
+            if job.future.done():
+                self._deferred.remove(job)
+                continue
+            if len(batch) >= self.max_batch:
+                break
+            if job.key == first.key:
+                self._deferred.remove(job)
+                batch.append(job)
+
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            try:
+                if timeout > 0:
+                    job = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    # past the window, only take what is already queued
+                    job = self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if job.future.done():
+                continue
+            if job.key == first.key:
+                batch.append(job)
+            else:
+                self._deferred.append(job)
+        return batch
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # callers that went away while the batch was filling up
+            batch = [job for job in batch if not job.future.done()]
+            for job in batch:
+                self._waiting.discard(job.future)
+            QUEUE_DEPTH.labels(self.name).set(self.depth)
+            if not batch:
+                continue
+            start = loop.time()
+            self.running = len(batch)
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    self.run_batch,
+                    batch[0].key,
+                    [job.item for job in batch],
+                )
+            except Exception as e:
+                logger.exception(f"{self.name} batch of {len(batch)} failed")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                continue
+            finally:
+                self.running = 0
+            elapsed = loop.time() - start
+            if self.avg_batch_seconds is None:
+                self.avg_batch_seconds = elapsed
+            else:
+                self.avg_batch_seconds = 0.8 * self.avg_batch_seconds + 0.2 * elapsed
+            for job, result in zip(batch, results):
+                if not job.future.done():
+                    job.future.set_result(result)
@@ -0,0 +1,29 @@
+from pydantic_settings import BaseSettings
+
+
+class EnvironmentSettings(BaseSettings):
+
+    sd35_model_path: str = "/data/models/sd35_lg"
+    # see common/exec_profile.py
+    sd35_exec_profile: str = "auto"
+    sd35_exec_headroom_gb: float = 6.0
+    sd35_vae_slicing: bool = False
+    sd35_vae_tiling: bool = False
+    sd35_cpu_threads: int = 0
+    # LRU of prompt embeddings, evicted entries spill to the directory if set
+    sd35_prompt_cache_mb: int = 512
+    sd35_prompt_cache_dir: str = ""
+    sd35_prompt_cache_disk_mb: int = 4096
+
+    # requests waiting for the GPU before new ones get a 503
+    sd35_max_queue: int = 32
+    # prompts sharing steps/guidance/sequence length run in one pipeline call
+    sd35_max_batch: int = 4
+    sd35_batch_wait: float = 0.05  # seconds to wait for a batch to fill up
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+
+
+env_settings = EnvironmentSettings()
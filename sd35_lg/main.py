@@ -1,35 +1,67 @@
-from io import BytesIO
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
 
 import torch
+from batcher import BatchExecutor, QueueFullError
+from common.exec_profile import apply_profile, execution_device, resolve_profile
+from common.image_encoding import encode_image, media_type, negotiate_format
+from common.metrics import instrument, track_inference
+from common.prompt_cache import PromptCache, sd3_prompt_kwargs
+from config import env_settings
 from diffusers import (
     BitsAndBytesConfig,
     SD3Transformer2DModel,
     StableDiffusion3Pipeline,
 )
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-
-app = FastAPI()
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+from previews import GenerationCancelled, PreviewStream, data_url, sse_event
+from pydantic import BaseModel, Field
 
 # Load the model and pipeline
-model_id = "/data/models/sd35_lg"
-
-nf4_config = BitsAndBytesConfig(
-    load_in_4bit=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=torch.bfloat16
-)
-
-model_nf4 = SD3Transformer2DModel.from_pretrained(
-    model_id,
-    subfolder="transformer",
-    quantization_config=nf4_config,
-    torch_dtype=torch.bfloat16,
+model_id = env_settings.sd35_model_path
+device = execution_device(env_settings.sd35_exec_profile)
+
+if device == "cuda":
+    nf4_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=torch.bfloat16,
+    )
+
+    model_nf4 = SD3Transformer2DModel.from_pretrained(
+        model_id,
+        subfolder="transformer",
+        quantization_config=nf4_config,
+        torch_dtype=torch.bfloat16,
+    )
+
+    pipeline = StableDiffusion3Pipeline.from_pretrained(
+        model_id, transformer=model_nf4, torch_dtype=torch.bfloat16
+    )
+else:
+    # bitsandbytes 4-bit kernels are cuda only
+    pipeline = StableDiffusion3Pipeline.from_pretrained(
+        model_id, torch_dtype=torch.float32
+    )
+
+profile = resolve_profile(
+    env_settings.sd35_exec_profile,
+    pipeline,
+    device,
+    headroom_bytes=int(env_settings.sd35_exec_headroom_gb * 2**30),
+    name="sd35",
 )
-
-pipeline = StableDiffusion3Pipeline.from_pretrained(
-    model_id, transformer=model_nf4, torch_dtype=torch.bfloat16
+apply_profile(
+    pipeline,
+    profile,
+    device,
+    vae_slicing=env_settings.sd35_vae_slicing,
+    vae_tiling=env_settings.sd35_vae_tiling,
+    cpu_threads=env_settings.sd35_cpu_threads,
 )
-pipeline.enable_model_cpu_offload()
 
 
 class ImageGenRequest(BaseModel):
@@ -38,32 +70,182 @@ class ImageGenRequest(BaseModel):
     num_inference_steps: int = 28
     guidance_scale: float = 4.5
     max_sequence_length: int = 512
+    # png, webp, jpeg or avif, defaults to what the Accept header prefers
+    format: Optional[str] = None
+    quality: Optional[int] = Field(None, ge=1, le=100)
 
 
-@app.post("/generate_image")
-async def generate_image(request: ImageGenRequest):
+prompt_cache = PromptCache(
+    max_bytes=env_settings.sd35_prompt_cache_mb * 2**20,
+    spill_dir=env_settings.sd35_prompt_cache_dir,
+    spill_max_bytes=env_settings.sd35_prompt_cache_disk_mb * 2**20,
+    name="sd35_prompt",
+)
+
+
+def run_batch(key: tuple, prompts: list[str]) -> list:
+    num_inference_steps, guidance_scale, max_sequence_length, stream = key
+    kwargs = {}
+    if stream is not None:
+        kwargs["callback_on_step_end"] = stream.on_step_end
+        kwargs["callback_on_step_end_tensor_inputs"] = ["latents"]
     try:
+        with track_inference("sd35"):
+            embeds = sd3_prompt_kwargs(
+                pipeline,
+                prompt_cache,
+                prompts,
+                max_sequence_length=max_sequence_length,
+                guidance_scale=guidance_scale,
+            )
+            return pipeline(
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                max_sequence_length=max_sequence_length,
+                **embeds,
+                **kwargs,
+            ).images
+    except GenerationCancelled:
+        # the offload hooks would otherwise keep the transformer on the GPU
+        pipeline.maybe_free_model_hooks()
+        logger.info("sd35 generation cancelled, the client went away")
+        return [None] * len(prompts)
+
+
+# how often a waiting /generate_image checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+
+executor = BatchExecutor(
+    run_batch,
+    max_queue=env_settings.sd35_max_queue,
+    max_batch=env_settings.sd35_max_batch,
+    max_wait=env_settings.sd35_batch_wait,
+    name="sd35",
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    executor.start()
+    yield
+    await executor.stop()
 
-        prompt = request.prompt
-        num_inference_steps = request.num_inference_steps
-        guidance_scale = request.guidance_scale
-        max_sequence_length = request.max_sequence_length
 
-        # Generate the image
-        image = pipeline(
-            prompt=prompt,
-            num_inference_steps=num_inference_steps,
-            guidance_scale=guidance_scale,
-            max_sequence_length=max_sequence_length,
-        ).images[0]
+app = FastAPI(lifespan=lifespan)
+instrument(app)
 
-        # Convert the image to a BytesIO object
-        image_bytes = BytesIO()
-        image.save(image_bytes, format="PNG")
-        image_bytes.seek(0)
 
-        # Return the image as a streaming response
-        return StreamingResponse(image_bytes, media_type="image/png")
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "profile": profile,
+        "queue_depth": executor.depth,
+        "running": executor.running,
+        "prompt_cache": prompt_cache.stats(),
+    }
 
+
+@app.post("/generate_image")
+async def generate_image(
+    request: ImageGenRequest, http_request: Request, accept: str = Header(None)
+):
+    try:
+        fmt = negotiate_format(request.format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # requests sharing these run as one batched pipeline call
+    key = (
+        request.num_inference_steps,
+        request.guidance_scale,
+        request.max_sequence_length,
+        None,
+    )
+    try:
+        result = executor.enqueue(key, request.prompt)
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        while not result.done():
+            await asyncio.wait({result}, timeout=DISCONNECT_POLL_SECONDS)
+            if not result.done() and await http_request.is_disconnected():
+                # nobody is left to answer, drop the job if it is still queued
+                logger.info("sd35 client went away while waiting")
+                return Response(status_code=499)
+        image = result.result()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        result.cancel()
+
+    content = await asyncio.to_thread(encode_image, image, fmt, request.quality)
+    return Response(content, media_type=media_type(fmt), headers={"Vary": "Accept"})
+
+
+class StreamImageGenRequest(ImageGenRequest):
+    # a preview every `preview_every` denoising steps
+    preview_every: int = Field(4, ge=1)
+
+
+@app.post("/generate_image/stream")
+async def generate_image_stream(request: StreamImageGenRequest):
+    """Server-sent `queued`, `preview`... events, then `image` or `error`."""
+    try:
+        fmt = negotiate_format(request.format, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = PreviewStream(request.num_inference_steps, request.preview_every)
+    # a stream runs alone, its key never matches another request
+    key = (
+        request.num_inference_steps,
+        request.guidance_scale,
+        request.max_sequence_length,
+        stream,
+    )
+    try:
+        result = executor.enqueue(key, request.prompt)
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    async def events():
+        preview = None
+        try:
+            yield sse_event("queued", {"queue_depth": executor.depth})
+            while not result.done():
+                preview = asyncio.ensure_future(stream.events.get())
+                await asyncio.wait(
+                    {preview, result}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not preview.done():
+                    break
+                yield sse_event("preview", preview.result())
+            try:
+                image = result.result()
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            content = await asyncio.to_thread(encode_image, image, fmt, request.quality)
+            yield sse_event(
+                "image", {"format": fmt, "image": data_url(content, media_type(fmt))}
+            )
+        finally:
+            # runs when the client disconnects too: drop the job if still
+            # queued, abort it at the next step if running
+            stream.cancelled.set()
+            result.cancel()
+            if preview is not None:
+                preview.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
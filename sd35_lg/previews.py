@@ -0,0 +1,89 @@
+"""Denoising previews for the streaming endpoint.
+
+Previews project the 16 latent channels straight to RGB with a fixed
+linear map instead of running the VAE, so one costs well under a
+millisecond on a 128x128 latent.
+"""
+
+import asyncio
+import base64
+import json
+import threading
+from io import BytesIO
+
+import torch
+from PIL import Image
+
+# SD3 latent channel -> RGB weights, as used by ComfyUI's latent previews
+SD3_LATENT_RGB_FACTORS = [
+    [-0.0922, -0.0175, 0.0749],
+    [0.0311, 0.0633, 0.0954],
+    [0.1994, 0.0927, 0.0458],
+    [0.0856, 0.0339, 0.0902],
+    [0.0587, 0.0272, -0.0496],
+    [-0.0006, 0.1104, 0.0309],
+    [0.0978, 0.0306, 0.0427],
+    [-0.0042, 0.1038, 0.1358],
+    [-0.0194, 0.0020, 0.0669],
+    [-0.0488, 0.0130, -0.0268],
+    [0.0922, 0.0580, 0.0713],
+    [0.0552, 0.1024, 0.0793],
+    [-0.0312, 0.0290, 0.0390],
+    [-0.0061, -0.0087, -0.0064],
+    [0.0346, 0.0346, -0.0025],
+    [0.0294, 0.0275, 0.0213],
+]
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def latents_to_image(latents: torch.Tensor) -> Image.Image:
+    """Approximate RGB of one (16, h, w) latent, at latent resolution."""
+    factors = torch.tensor(
+        SD3_LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device
+    )
+    rgb = torch.einsum("chw,cr->hwr", latents.float(), factors)
+    rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8)
+    return Image.fromarray(rgb.cpu().numpy())
+
+
+def data_url(content: bytes, media_type: str) -> str:
+    return f"data:{media_type};base64,{base64.b64encode(content).decode()}"
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class PreviewStream:
+    """Passes previews from the GPU thread to the SSE response.
+
+    Setting `cancelled` aborts the run at the next step, the callback
+    raises `GenerationCancelled` out of the pipeline.
+    """
+
+    def __init__(self, total_steps: int, every: int):
+        self.total_steps = total_steps
+        self.every = every
+        self.cancelled = threading.Event()
+        self.events: asyncio.Queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+
+    def on_step_end(self, pipe, step: int, timestep, callback_kwargs: dict) -> dict:
+        if self.cancelled.is_set():
+            raise GenerationCancelled()
+        done = step + 1
+        if done % self.every == 0 and done < self.total_steps:
+            buffer = BytesIO()
+            latents_to_image(callback_kwargs["latents"][0]).save(
+                buffer, format="JPEG", quality=80
+            )
+            preview = {
+                "step": done,
+                "total": self.total_steps,
+                "image": data_url(buffer.getvalue(), "image/jpeg"),
+            }
+            self._loop.call_soon_threadsafe(self.events.put_nowait, preview)
+        return callback_kwargs
@@ -32,6 +32,9 @@ kill_celery_processes() {
     fi
 }
 
+# Kill the worker launcher, it forwards the signal to its workers
+kill_process "python -m worker.launch"
+
 # Kill Celery worker processes
 kill_celery_processes "worker"
 
@@ -1,25 +1,62 @@
+import json
+import math
 import os
+import time
+import uuid
 from contextlib import asynccontextmanager
+from traceback import format_exc
 from typing import Optional
 
-from celery.result import AsyncResult
+import redis
 from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile, status
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
+from common.celery_client import get_celery_client, img_to_video_task_name
 from common.config import env_settings
-from common.qiniu_conn import get_qiniu
-from svd_service.auth import get_token
-from svd_service.utils import validate_image_file
-from worker.app import app as celery_app
+from common.lanes import lane_queue, lane_queues
+from common.metrics import QUEUE_DEPTH, instrument
+from common.queue_stats import get_queue_stats
+from common.redis_conn import get_async_redis_conn
+from common.renditions import RENDITIONS, parse_renditions, rendition_urls
+from common.result_cache import get_result_cache, make_cache_key
+from common.storage import LocalStorage, get_storage
+from common.svd_presets import DEFAULT_QUALITY, PRESETS
+from common.task_progress import PROGRESS_KEY, format_progress
+from common.worker_health import get_heartbeats
+from svd_service.auth import get_lane, get_token
+from svd_service.utils import (
+    BodySizeLimitMiddleware,
+    fetch_image_key,
+    ingest_image_file,
+)
+
+storage = get_storage()
+aredis_conn = get_async_redis_conn()
+result_cache = get_result_cache()
+celery_app = get_celery_client()
 
-q = get_qiniu()
+IMG_TO_VIDEO_TASK = img_to_video_task_name()
+
+MAX_BULK_TASK_IDS = 500
+PING_TIMEOUT = 1.0
+INPUTS_UPLOAD_DIR = "svd_materials/inputs"
+# room for the boundaries and form fields around the image
+MULTIPART_OVERHEAD = 64 * 1024
 
 deps = [Depends(get_token)]
 
 
-app = FastAPI(dependencies=deps)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await storage.aclose()
+    await aredis_conn.connection_pool.disconnect()
+
+
+app = FastAPI(dependencies=deps, lifespan=lifespan)
 
 
 app.add_middleware(
@@ -35,16 +72,123 @@ app.add_middleware(
     ),
     allow_headers=["*"],
 )
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=env_settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    paths=("/img2vid/create_task",),
+)
+
+
+async def _refresh_queue_depth():
+    queues = lane_queues()
+    pipe = aredis_conn.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    for queue, depth in zip(queues, await pipe.execute()):
+        QUEUE_DEPTH.labels(queue).set(depth)
+
+
+instrument(app, on_scrape=_refresh_queue_depth)
+
+if isinstance(storage, LocalStorage):
+    # mounted apps skip the token dependency, like public bucket urls
+    app.mount("/files", storage.asgi_app())
 
 
 @app.get("/celery_health_check")
 async def celery_health_check():
-    task = celery_app.send_task("health_check", args=[3, 4])
-    return {"task_id": task.id}
+    """Probe the broker, the workers and their models without sending a task.
+
+    Workers answer `control.ping` from their main process and publish model
+    state through Redis heartbeats, so a busy GPU slot is never touched.
+    """
+    start = time.perf_counter()
+    try:
+        await aredis_conn.ping()
+    except redis.RedisError as e:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "down", "broker": {"reachable": False, "error": str(e)}},
+        )
+    broker_ms = (time.perf_counter() - start) * 1000
+
+    heartbeats = await get_heartbeats(aredis_conn)
+    start = time.perf_counter()
+    replies = await run_in_threadpool(
+        celery_app.control.ping, timeout=PING_TIMEOUT, limit=len(heartbeats) or None
+    )
+    ping_ms = (time.perf_counter() - start) * 1000
+    responding = sorted(name for reply in replies for name in reply)
+
+    now = time.time()
+    processes = {
+        name: {
+            "device": state.get("device"),
+            "gpu": state.get("gpu"),
+            "model_loaded": state.get("model_loaded") == "1",
+            "last_seen_seconds": round(now - float(state.get("updated_at", 0)), 1),
+        }
+        for name, state in heartbeats.items()
+    }
+    models_loaded = sum(p["model_loaded"] for p in processes.values())
+    healthy = bool(responding) and models_loaded > 0
+    return JSONResponse(
+        status_code=(
+            status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content={
+            "status": "ok" if healthy else "degraded",
+            "broker": {"reachable": True, "latency_ms": round(broker_ms, 1)},
+            "workers": {
+                "responding": responding,
+                "ping_round_trip_ms": round(ping_ms, 1) if responding else None,
+            },
+            "models_loaded": models_loaded,
+            "pool_processes": processes,
+        },
+    )
+
+
+async def _check_admission() -> Optional[JSONResponse]:
+    """Return a 429 response when the backlog is over the configured limits."""
+    max_depth = env_settings.SVD_MAX_QUEUE_DEPTH
+    max_wait = env_settings.SVD_MAX_WAIT_SECONDS
+    if not max_depth and not max_wait:
+        return None
+    stats = await get_queue_stats(
+        aredis_conn, queues=lane_queues(), worker_slots=env_settings.SVD_WORKER_SLOTS
+    )
+    wait = stats["predicted_wait_seconds"]
+    avg = stats["avg_task_seconds"]
+    retry_after = None
+    if max_wait and wait is not None and wait > max_wait:
+        retry_after = wait - max_wait
+    elif max_depth and stats["queued_total"] >= max_depth:
+        excess = stats["queued_total"] - max_depth + 1
+        retry_after = excess * avg / env_settings.SVD_WORKER_SLOTS if avg else 60
+    if retry_after is None:
+        return None
+    retry_after = max(math.ceil(retry_after), 1)
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={
+            "message": "The queue is full, please retry later.",
+            "predicted_wait_seconds": wait,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
 
 
 @app.post("/img2vid/create_task")
-async def create_img2vid_task(file: UploadFile = File(None), img_key: str = Form(None)):
+async def create_img2vid_task(
+    file: UploadFile = File(None),
+    img_key: str = Form(None),
+    motion_bucket_id: int = Form(32),
+    noise_aug_strength: float = Form(0.02),
+    quality: str = Form(DEFAULT_QUALITY),
+    renditions: str = Form("mp4"),
+    lane: str = Depends(get_lane),
+):
     if file and img_key:
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -57,19 +201,86 @@ async def create_img2vid_task(file: UploadFile = File(None), img_key: str = Form
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"message": "Please provide either a file or an image URL."},
         )
+    if quality not in PRESETS:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"quality must be one of: {', '.join(PRESETS)}."},
+        )
+    try:
+        renditions = parse_renditions(renditions)
+    except ValueError:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "message": f"renditions must be a comma separated list of: "
+                f"{', '.join(RENDITIONS)}."
+            },
+        )
 
+    img_path = None
     try:
         if file:
-            img_path = validate_image_file(upload_file=file)
+            ext, digest = await run_in_threadpool(ingest_image_file, file)
         else:
-            out_dir = os.path.join(env_settings.DATA_DIR, "svd_materials")
-            if not os.path.exists(out_dir):
-                os.makedirs(out_dir, exist_ok=True)
-            img_path = q.download_file(
-                img_key,
-                output_dir=out_dir,
+            img_path, digest = await fetch_image_key(storage, img_key)
+        params = {
+            "motion_bucket_id": motion_bucket_id,
+            "noise_aug_strength": noise_aug_strength,
+            "quality": quality,
+            "renditions": renditions,
+        }
+        cache_key = make_cache_key(digest, params)
+        keys = await result_cache.alookup(cache_key)
+        if keys:
+            # finished before: hand back a completed task without touching the GPU
+            task_id = str(uuid.uuid4())
+            await run_in_threadpool(
+                celery_app.backend.store_result,
+                task_id,
+                rendition_urls(keys, storage.get_public_url),
+                "SUCCESS",
+            )
+            return {"task_id": task_id, "cached": True}
+
+        # admit before claiming: a claim hands its task id to other requests
+        rejection = await _check_admission()
+        if rejection is not None:
+            return rejection
+
+        task_id = str(uuid.uuid4())
+        running_id = await result_cache.aclaim(cache_key, task_id)
+        if running_id:
+            return {"task_id": running_id, "cached": True}
+
+        try:
+            # workers may run on other nodes, hand them an object key, not a path
+            if file:
+                input_key = await storage.aput_fileobj(
+                    file.file, f"{INPUTS_UPLOAD_DIR}/{digest}.{ext}"
+                )
+            else:
+                input_key = img_key
+            # publishing is a blocking broker round trip
+            task = await run_in_threadpool(
+                celery_app.send_task,
+                IMG_TO_VIDEO_TASK,
+                args=[{"key": input_key, "sha256": digest}],
+                kwargs={**params, "cache_key": cache_key},
+                task_id=task_id,
+                queue=lane_queue(lane),
             )
-        task = celery_app.send_task("img_to_video", args=[img_path])
+        except Exception as exc:
+            # requests that joined the claim hold this id, fail it for them
+            try:
+                await run_in_threadpool(
+                    celery_app.backend.mark_as_failure,
+                    task_id,
+                    exc,
+                    traceback=format_exc(),
+                )
+            finally:
+                await result_cache.arelease(cache_key, task_id)
+            raise
         return {"task_id": task.id}
     except HTTPException as e:
         return JSONResponse(
@@ -78,21 +289,26 @@ async def create_img2vid_task(file: UploadFile = File(None), img_key: str = Form
                 "message": e.detail,
             },
         )
+    finally:
+        if img_path and os.path.exists(img_path):
+            os.remove(img_path)
 
 
-@app.get("/task_status/{task_id}")
-async def check_task_status(task_id: str):
-    task_result = AsyncResult(task_id, app=celery_app)
-    status = task_result.status
-
-    if task_result.state == "PENDING":
-        return {"status": "in_queue"}
-    elif status == "STARTED":
-        return {"status": "running"}
+def _task_status_payload(
+    status: str, result, traceback: Optional[str], progress: Optional[dict]
+) -> dict:
+    if status in ("PENDING", "STARTED"):
+        # batched tasks stay PENDING until done, their progress says otherwise
+        if status == "PENDING" and progress is None:
+            return {"status": "in_queue"}
+        return {"status": "running", "progress": progress}
     elif status == "SUCCESS":
-        result = task_result.result
         if result and "url" in result:
-            return {"status": "success", "url": result["url"]}
+            payload = {"status": "success", "url": result["url"]}
+            for field in ("urls", "timings", "peak_memory"):
+                if field in result:
+                    payload[field] = result[field]
+            return payload
         else:
             return {
                 "status": "success",
@@ -101,11 +317,83 @@ async def check_task_status(task_id: str):
     elif status == "FAILURE":
         return {
             "status": "failure",
-            "message": task_result.traceback or "Unknown error",
+            "message": traceback or "Unknown error",
         }
     return {"status": "unknown", "message": status}
 
 
+async def _load_task_states(task_ids: list[str]) -> list[tuple[dict, dict]]:
+    """Result meta and raw progress of every task, in one round trip."""
+    pipe = aredis_conn.pipeline(transaction=False)
+    pipe.mget(
+        [celery_app.backend.get_key_for_task(task_id).decode() for task_id in task_ids]
+    )
+    for task_id in task_ids:
+        pipe.hgetall(PROGRESS_KEY.format(task_id))
+    metas, *progresses = await pipe.execute()
+    return [
+        (json.loads(meta) if meta else {"status": "PENDING"}, progress)
+        for meta, progress in zip(metas, progresses)
+    ]
+
+
+@app.get("/task_status/{task_id}")
+async def check_task_status(task_id: str):
+    meta, progress = (await _load_task_states([task_id]))[0]
+    return _task_status_payload(
+        meta["status"],
+        meta.get("result"),
+        meta.get("traceback"),
+        format_progress(progress),
+    )
+
+
+class BulkTaskStatusRequest(BaseModel):
+    task_ids: list[str]
+
+
+@app.post("/task_status")
+async def check_tasks_status(request: BulkTaskStatusRequest):
+    task_ids = list(dict.fromkeys(request.task_ids))
+    if len(task_ids) > MAX_BULK_TASK_IDS:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"At most {MAX_BULK_TASK_IDS} task ids per request."},
+        )
+    if not task_ids:
+        return {"tasks": {}}
+
+    tasks = {}
+    states = await _load_task_states(task_ids)
+    for task_id, (meta, progress) in zip(task_ids, states):
+        payload = _task_status_payload(
+            meta["status"], meta.get("result"), None, format_progress(progress)
+        )
+        if payload["status"] == "running" and payload["progress"]:
+            payload["progress"] = {
+                "percent": payload["progress"]["percent"],
+                "eta_seconds": payload["progress"]["eta_seconds"],
+            }
+        for field in ("message", "timings", "peak_memory"):
+            payload.pop(field, None)
+        tasks[task_id] = payload
+    return {"tasks": tasks}
+
+
+@app.get("/queue_stats")
+async def queue_stats():
+    return await get_queue_stats(
+        aredis_conn,
+        queues=lane_queues(),
+        worker_slots=env_settings.SVD_WORKER_SLOTS,
+    )
+
+
+@app.get("/img2vid/cache_stats")
+async def img2vid_cache_stats():
+    return await result_cache.astats()
+
+
 @app.get("/health")
 async def health():
     return {"message": "ok"}
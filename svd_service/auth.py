@@ -5,6 +5,7 @@ from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBearer
 from starlette import status
 
 from common.config import env_settings
+from common.lanes import lane_for_token
 
 # Constants for messages
 UNAUTHORIZED_DETAIL = "Bearer token missing or unknown"
@@ -23,3 +24,7 @@ async def get_token(
             detail=UNAUTHORIZED_DETAIL,
         )
     return auth.credentials
+
+
+async def get_lane(token: str = Depends(get_token)) -> str:
+    return lane_for_token(token)
@@ -1,46 +1,214 @@
-import io
+import asyncio
+import hashlib
 import os
+import tempfile
+from typing import Optional
 
+import aiohttp
 from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from loguru import logger
 from PIL import Image
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from common.config import env_settings
+from common.storage import Storage
 
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
+CHUNK_SIZE = 64 * 1024
+HEADER_SIZE = 16
 
-def verify_image(image_data: io.BytesIO) -> io.BytesIO:
-    """Verify image and return the open stream."""
-    try:
-        # Open the image to verify it's valid
-        image_data.seek(0)  # Ensure the stream's pointer is at the start
-        with Image.open(image_data) as image:
-            image.verify()  # Verify the image without loading it
-        image_data.seek(0)  # Reset the stream's pointer after verification
-    except (IOError, SyntaxError) as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
-    return image_data  # Return the reset stream
 
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Return the file extension matching the image signature, if allowed."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
 
-def save_image(filename: str, image_data: io.BytesIO) -> str:
-    """Save the image data to a file."""
+
+def get_materials_dir() -> str:
     out_dir = os.path.join(env_settings.DATA_DIR, "svd_materials")
     if not os.path.exists(out_dir):
         os.makedirs(out_dir, exist_ok=True)
-    img_path = os.path.join(out_dir, filename)
-    with open(img_path, "wb") as f:
-        f.write(image_data.getvalue())  # Write the image data to file
-    return img_path
+    return out_dir
+
+
+class ImageSink:
+    """Stream image bytes to disk while hashing and size-checking them.
+
+    Every sink writes its own uniquely named file, so concurrent requests
+    never touch each other's data; deduplication happens in object storage,
+    where inputs are stored under their content hash.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes or env_settings.MAX_UPLOAD_BYTES
+        self.out_dir = get_materials_dir()
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.out_dir, prefix="upload-")
+        self.file = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.header = b""
+        self.ext = None
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail="Image file too large.")
+        if self.ext is None:
+            self.header += chunk[:HEADER_SIZE]
+            if len(self.header) >= HEADER_SIZE:
+                self._check_header()
+        self.digest.update(chunk)
+        self.file.write(chunk)
 
+    def _check_header(self):
+        self.ext = sniff_image_format(self.header)
+        if self.ext is None:
+            raise HTTPException(status_code=400, detail="Invalid image file.")
 
-def validate_image_file(upload_file: UploadFile) -> str:
+    def finalize(self) -> tuple[str, str]:
+        """Close the sink and return the stored path and content hash."""
+        self.file.close()
+        if self.ext is None:
+            self._check_header()
+        try:
+            # only parses the header, the pixel data is never decoded here
+            with Image.open(self.tmp_path) as image:
+                image.size
+        except (IOError, SyntaxError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+        img_path = f"{self.tmp_path}.{self.ext}"
+        os.replace(self.tmp_path, img_path)
+        return img_path, self.digest.hexdigest()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def ingest_image_file(upload_file: UploadFile) -> tuple[str, str]:
+    """Validate an uploaded image in place, return its extension and sha256.
+
+    The spooled upload is only read, never copied; store it with
+    `Storage.put_fileobj`.
+    """
     extension = upload_file.filename.split(".")[-1].lower()
     if extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Unsupported file extension.")
     if upload_file.content_type not in ALLOWED_MIME_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported MIME type.")
-    upload_file.file.seek(0)
-    image_data = io.BytesIO(upload_file.file.read())
-    verified_image = verify_image(image_data)
-    return save_image(upload_file.filename, verified_image)
+
+    f = upload_file.file
+    size = f.seek(0, os.SEEK_END)
+    if size > env_settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image file too large.")
+    f.seek(0)
+    ext = sniff_image_format(f.read(HEADER_SIZE))
+    if ext is None:
+        raise HTTPException(status_code=400, detail="Invalid image file.")
+
+    f.seek(0)
+    digest = hashlib.sha256()
+    while chunk := f.read(CHUNK_SIZE):
+        digest.update(chunk)
+    f.seek(0)
+    try:
+        # only parses the header, and leaves the file object open
+        with Image.open(f) as image:
+            image.size
+    except (IOError, SyntaxError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+    f.seek(0)
+    return ext, digest.hexdigest()
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over `max_bytes` on `paths` before they are parsed.
+
+    A declared Content-Length is checked up front, chunked bodies are counted
+    as they are received.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, paths: tuple[str, ...] = ()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or (self.paths and scope["path"] not in self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse(
+            status_code=413, content={"message": "Image file too large."}
+        )
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            if exceeded:
+                # the form parser turns the abort into its own error, replaced below
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await too_large(scope, receive, send)
+
+
+async def fetch_image_key(q: Storage, img_key: str) -> tuple[str, str]:
+    """Download an image from object storage, return its path and sha256."""
+    sink = ImageSink()
+    try:
+        async for chunk in q.aiter_file(img_key, chunk_size=CHUNK_SIZE):
+            sink.write(chunk)
+        return sink.finalize()
+    except (
+        aiohttp.ClientError,
+        asyncio.TimeoutError,
+        FileNotFoundError,
+        IsADirectoryError,
+        ValueError,
+    ) as e:
+        # remote fetch failures, or a missing/invalid key on local storage
+        sink.abort()
+        logger.error(f"Failed to fetch {img_key}: {e!r}")
+        raise HTTPException(status_code=400, detail="Failed to fetch image.")
+    except BaseException:
+        sink.abort()
+        raise
@@ -0,0 +1,17 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# required by common.config, nothing under test connects anywhere
+for name, value in {
+    "SERVICE_ACCESS_TOKEN": "test",
+    "SVD_MODEL_DIR": "/nonexistent",
+    "REDIS_HOST": "127.0.0.1",
+    "REDIS_PORT": "6379",
+    "REDIS_PWD": "",
+    "DATA_DIR": "/tmp",
+}.items():
+    os.environ.setdefault(name, value)
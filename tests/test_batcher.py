@@ -0,0 +1,188 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# sd35_lg runs with its own directory on sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "sd35_lg"))
+
+from batcher import BatchExecutor, QueueFullError  # noqa: E402
+
+
+class Recorder:
+    """`run_batch` that records its calls, blocking while `gate` is clear."""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, key, items):
+        self.gate.wait()
+        self.calls.append((key, list(items)))
+        return [f"{key}:{item}" for item in items]
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def _executor(run_batch, **kwargs) -> BatchExecutor:
+    options = {"max_queue": 16, "max_batch": 3, "max_wait": 0.05, "name": "test"}
+    return BatchExecutor(run_batch, **{**options, **kwargs})
+
+
+def test_jobs_are_grouped_by_key():
+    recorder = Recorder()
+
+    async def scenario():
+        executor = _executor(recorder)
+        executor.start()
+        futures = [
+            executor.enqueue(key, item)
+            for key, item in [("a", 1), ("b", 2), ("a", 3), ("a", 4), ("a", 5)]
+        ]
+        results = await asyncio.gather(*futures)
+        await executor.stop()
+        return results
+
+    results = _run(scenario())
+
+    assert results == ["a:1", "b:2", "a:3", "a:4", "a:5"]
+    # the first batch is capped at max_batch, other keys wait their turn
+    assert recorder.calls == [("a", [1, 3, 4]), ("b", [2]), ("a", [5])]
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    recorder = Recorder()
+
+    async def scenario():
+        executor = _executor(recorder, max_wait=0.1)
+        executor.start()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await executor.submit("a", 1)
+        elapsed = loop.time() - start
+        await executor.stop()
+        return result, elapsed
+
+    result, elapsed = _run(scenario())
+
+    assert result == "a:1"
+    assert 0.1 <= elapsed < 1
+    assert recorder.calls == [("a", [1])]
+
+
+def test_cancelled_jobs_are_skipped():
+    recorder = Recorder()
+    recorder.gate.clear()
+
+    async def scenario():
+        executor = _executor(recorder, max_batch=1, max_wait=0)
+        executor.start()
+        running = executor.enqueue("a", 1)
+        while not executor.running:
+            await asyncio.sleep(0.01)
+        dropped = executor.enqueue("a", 2)
+        kept = executor.enqueue("a", 3)
+        dropped.cancel()
+        recorder.gate.set()
+        results = await asyncio.gather(running, kept)
+        await executor.stop()
+        return results
+
+    assert _run(scenario()) == ["a:1", "a:3"]
+    assert recorder.calls == [("a", [1]), ("a", [3])]
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    recorder = Recorder()
+    recorder.gate.clear()
+
+    async def scenario():
+        executor = _executor(recorder, max_queue=2, max_batch=1, max_wait=0)
+        executor.start()
+        futures = [executor.enqueue("a", 1)]
+        while not executor.running:
+            await asyncio.sleep(0.01)
+        futures += [executor.enqueue("a", 2), executor.enqueue("a", 3)]
+        with pytest.raises(QueueFullError) as exc_info:
+            executor.enqueue("a", 4)
+        recorder.gate.set()
+        await asyncio.gather(*futures)
+        await executor.stop()
+        return exc_info.value
+
+    error = _run(scenario())
+    assert error.retry_after >= 1
+
+
+def test_failed_batch_fails_every_job():
+    def run_batch(key, items):
+        raise RuntimeError("out of memory")
+
+    async def scenario():
+        executor = _executor(run_batch)
+        executor.start()
+        futures = [executor.enqueue("a", 1), executor.enqueue("a", 2)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await executor.stop()
+        return results
+
+    results = _run(scenario())
+    assert [str(e) for e in results] == ["out of memory", "out of memory"]
+
+
+def test_stop_waits_for_the_running_batch_without_blocking_the_loop():
+    recorder = Recorder()
+    recorder.gate.clear()
+
+    async def scenario():
+        executor = _executor(recorder, max_batch=1, max_wait=0)
+        executor.start()
+        executor.enqueue("a", 1)
+        while not executor.running:
+            await asyncio.sleep(0.01)
+        threading.Timer(0.3, recorder.gate.set).start()
+        stopping = asyncio.create_task(executor.stop())
+        ticks = 0
+        while not stopping.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        await stopping
+        return ticks, executor._task.cancelled()
+
+    ticks, cancelled = _run(scenario())
+    assert ticks > 5
+    assert cancelled
+    assert recorder.calls == [("a", [1])]
+
+
+def test_cancelled_jobs_do_not_count_toward_depth():
+    recorder = Recorder()
+    recorder.gate.clear()
+
+    async def scenario():
+        executor = _executor(recorder, max_queue=2, max_batch=1, max_wait=0)
+        executor.start()
+        running = executor.enqueue("a", 1)
+        while not executor.running:
+            await asyncio.sleep(0.01)
+        for future in [executor.enqueue("a", 2), executor.enqueue("a", 3)]:
+            future.cancel()
+        await asyncio.sleep(0)
+        depth_after_cancel = executor.depth
+        try:
+            kept = [executor.enqueue("a", 4), executor.enqueue("a", 5)]
+        finally:
+            recorder.gate.set()
+        results = await asyncio.gather(running, *kept)
+        await executor.stop()
+        return depth_after_cancel, results
+
+    depth_after_cancel, results = _run(scenario())
+    assert depth_after_cancel == 0
+    assert results == ["a:1", "a:4", "a:5"]
+    assert recorder.calls == [("a", [1]), ("a", [4]), ("a", [5])]
@@ -0,0 +1,40 @@
+import pytest
+
+from common.image_encoding import DEFAULT_FORMAT, FORMATS, negotiate_format
+
+
+def test_explicit_format_wins_over_accept():
+    assert negotiate_format("WEBP", "image/png") == "webp"
+    assert negotiate_format("jpg", None) == "jpeg"
+
+
+def test_unsupported_explicit_format_raises():
+    with pytest.raises(ValueError):
+        negotiate_format("gif", None)
+
+
+@pytest.mark.parametrize("accept", [None, "", "*/*", "image/*", "text/html"])
+def test_default_without_a_usable_accept(accept):
+    assert negotiate_format(None, accept) == DEFAULT_FORMAT
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        ("image/jpeg", "jpeg"),
+        ("image/png;q=0.5, image/webp;q=0.9", "webp"),
+        ("image/webp;q=0.4,image/jpeg;q=0.8,*/*;q=1", "jpeg"),
+        # a tie goes to the preferred format
+        ("image/png, image/jpeg, image/webp", "webp"),
+        # q=0 means not acceptable
+        ("image/webp;q=0, image/jpeg;q=0.1", "jpeg"),
+        ("image/webp;q=oops, image/png;q=0.2", "png"),
+    ],
+)
+def test_accept_q_values(accept, expected):
+    assert negotiate_format(None, accept) == expected
+
+
+@pytest.mark.skipif("avif" not in FORMATS, reason="Pillow cannot write AVIF")
+def test_avif_preferred_on_a_tie():
+    assert negotiate_format(None, "image/webp, image/avif") == "avif"
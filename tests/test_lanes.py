@@ -0,0 +1,50 @@
+from collections import Counter
+
+from common.lanes import WeightedCycle
+
+INTERACTIVE, BATCH = "svd_interactive", "svd_batch"
+
+
+def _cycle() -> WeightedCycle:
+    cycle = WeightedCycle([BATCH, INTERACTIVE])
+    cycle.weights = {INTERACTIVE: 4, BATCH: 1}
+    return cycle
+
+
+def _serve(cycle: WeightedCycle, busy: set, rounds: int) -> list[str]:
+    """Mimic kombu: BRPOP in `consume` order, report where a message came from."""
+    served = []
+    for _ in range(rounds):
+        order = cycle.consume(len(cycle.items))
+        queue = next(queue for queue in order if queue in busy)
+        served.append(cycle.rotate(queue))
+    return served
+
+
+def test_busy_lanes_are_served_by_weight():
+    served = _serve(_cycle(), {INTERACTIVE, BATCH}, 50)
+    assert Counter(served) == {INTERACTIVE: 40, BATCH: 10}
+    # smooth: the light lane is spread out, never starved for a whole cycle
+    assert all(BATCH in served[i : i + 5] for i in range(0, 50, 5))
+
+
+def test_idle_lane_banks_no_credit():
+    cycle = _cycle()
+    _serve(cycle, {INTERACTIVE}, 20)
+    assert cycle.credits[BATCH] == 0
+
+    served = _serve(cycle, {INTERACTIVE, BATCH}, 10)
+    assert Counter(served) == {INTERACTIVE: 8, BATCH: 2}
+
+
+def test_unknown_queue_gets_weight_one():
+    cycle = _cycle()
+    cycle.update([INTERACTIVE, BATCH, "celery"])
+    served = _serve(cycle, {INTERACTIVE, BATCH, "celery"}, 60)
+    assert Counter(served) == {INTERACTIVE: 40, BATCH: 10, "celery": 10}
+
+
+def test_rotate_ignores_queues_it_does_not_order():
+    cycle = _cycle()
+    assert cycle.rotate("other") == "other"
+    assert not cycle.credits
@@ -0,0 +1,85 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from common.prompt_cache import PromptCache, prompt_key  # noqa: E402
+
+# one float32 embedding pair is 4 * (8 + 2) = 40 bytes
+ENTRY_BYTES = 40
+
+
+class Encoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts: list[str]):
+        self.calls.append(list(texts))
+        return [
+            (torch.full((1, 8), float(len(text))), torch.full((1, 2), -1.0))
+            for text in texts
+        ]
+
+
+def test_prompt_key_only_normalizes_whitespace():
+    assert prompt_key("a  red\ncar", 77) == prompt_key("a red car", 77)
+    assert prompt_key("A red car", 77) != prompt_key("a red car", 77)
+    assert prompt_key("a red car", 77) != prompt_key("a red car", 256)
+
+
+def test_misses_are_encoded_once_in_one_call():
+    cache, encode = PromptCache(max_bytes=10 * ENTRY_BYTES), Encoder()
+
+    first = cache.get_many(["cat", "dog", "cat"], 77, encode)
+    second = cache.get_many(["dog", "cat"], 77, encode)
+
+    assert encode.calls == [["cat", "dog"]]
+    assert torch.equal(first[0][0], second[1][0])
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, encode = PromptCache(max_bytes=2 * ENTRY_BYTES), Encoder()
+    cache.get_many(["a", "b"], 77, encode)
+    cache.get_many(["a"], 77, encode)  # b is now the oldest
+    cache.get_many(["c"], 77, encode)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * ENTRY_BYTES
+    cache.get_many(["a", "b"], 77, encode)
+    assert encode.calls[-1] == ["b"]
+
+
+def test_evicted_entries_spill_to_disk_and_come_back(tmp_path):
+    cache = PromptCache(
+        max_bytes=ENTRY_BYTES, spill_dir=str(tmp_path), spill_max_bytes=2**20
+    )
+    encode = Encoder()
+    [(embeds, _)] = cache.get_many(["spilled"], 77, encode)
+    cache.get_many(["other"], 77, encode)
+    assert (tmp_path / f"{prompt_key('spilled', 77)}.pt").exists()
+
+    [(reloaded, _)] = cache.get_many(["spilled"], 77, encode)
+    assert torch.equal(reloaded, embeds)
+    assert encode.calls == [["spilled"], ["other"]]
+
+
+def test_spill_directory_is_capped(tmp_path):
+    cache = PromptCache(
+        max_bytes=ENTRY_BYTES, spill_dir=str(tmp_path), spill_max_bytes=1
+    )
+    for text in ("one", "two", "three"):
+        cache.get_many([text], 77, Encoder())
+    assert not list(tmp_path.glob("*.pt"))
+
+
+def test_unreadable_spill_file_is_dropped(tmp_path):
+    cache = PromptCache(
+        max_bytes=ENTRY_BYTES, spill_dir=str(tmp_path), spill_max_bytes=2**20
+    )
+    (tmp_path / f"{prompt_key('broken', 77)}.pt").write_bytes(b"not a tensor")
+    encode = Encoder()
+
+    cache.get_many(["broken"], 77, encode)
+
+    assert encode.calls == [["broken"]]
+    assert not (tmp_path / f"{prompt_key('broken', 77)}.pt").exists()
@@ -0,0 +1,197 @@
+"""QiNiuConnector uploads against a local aiohttp stand-in of the upload API."""
+
+import asyncio
+import io
+import threading
+
+import pytest
+import requests
+from aiohttp import web
+
+from common.qiniu_conn import MIN_PART_SIZE, QiNiuConnector
+
+
+class UploadServer:
+    """Form upload and resumable upload v2, just enough to drive the client."""
+
+    def __init__(self):
+        self.forms = []
+        self.parts = {}
+        self.completed = []
+        self.aborted = []
+        # part number -> statuses to answer before accepting the part
+        self.part_failures = {}
+        self.attempts = {}
+
+        app = web.Application(client_max_size=16 * MIN_PART_SIZE)
+        base = "/buckets/{bucket}/objects/{key}/uploads"
+        app.router.add_post("/", self.form)
+        app.router.add_post(base, self.init)
+        app.router.add_put(base + "/{upload_id}/{part}", self.put_part)
+        app.router.add_post(base + "/{upload_id}", self.complete)
+        app.router.add_delete(base + "/{upload_id}", self.abort)
+        self.app = app
+
+    async def form(self, request):
+        data = await request.post()
+        self.forms.append(
+            {
+                "key": data["key"],
+                "token": data["token"],
+                "body": data["file"].file.read(),
+            }
+        )
+        return web.json_response({"key": data["key"]})
+
+    async def init(self, request):
+        return web.json_response({"uploadId": "upload-1"})
+
+    async def put_part(self, request):
+        part = int(request.match_info["part"])
+        self.attempts[part] = self.attempts.get(part, 0) + 1
+        failures = self.part_failures.get(part)
+        if failures:
+            return web.Response(status=failures.pop(0))
+        self.parts[part] = await request.read()
+        return web.json_response({"etag": f"etag-{part}"})
+
+    async def complete(self, request):
+        self.completed.append(await request.json())
+        return web.json_response({"key": request.match_info["key"]})
+
+    async def abort(self, request):
+        self.aborted.append(request.match_info["upload_id"])
+        return web.json_response({})
+
+
+@pytest.fixture
+def server():
+    stand_in = UploadServer()
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(stand_in.app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    stand_in.url = "http://127.0.0.1:%d" % site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def connector(server):
+    return QiNiuConnector(
+        ak="ak",
+        sk="sk",
+        bucket_name="bucket",
+        bucket_domain="cdn.example.com",
+        up_host=server.url,
+        part_size=MIN_PART_SIZE,
+        retries=2,
+    )
+
+
+def _payload(size: int) -> bytes:
+    return bytes(i % 251 for i in range(size))
+
+
+def test_small_file_uses_form_upload(server, connector, tmp_path):
+    path = tmp_path / "in.png"
+    path.write_bytes(b"small image")
+
+    assert connector.put_file(str(path), "inputs/in.png") == "inputs/in.png"
+    assert [form["key"] for form in server.forms] == ["inputs/in.png"]
+    assert server.forms[0]["body"] == b"small image"
+    assert server.forms[0]["token"].startswith("ak:")
+    assert not server.parts
+
+
+@pytest.mark.parametrize("source", ["file", "bytes", "fileobj"])
+def test_large_upload_is_split_into_parts(server, connector, tmp_path, source):
+    data = _payload(2 * MIN_PART_SIZE + 123)
+    if source == "file":
+        path = tmp_path / "out.mp4"
+        path.write_bytes(data)
+        connector.put_file(str(path), "videos/out.mp4")
+    elif source == "bytes":
+        connector.put_bytes(data, "videos/out.mp4")
+    else:
+        connector.put_fileobj(io.BytesIO(data), "videos/out.mp4")
+
+    assert sorted(server.parts) == [1, 2, 3]
+    assert b"".join(server.parts[n] for n in (1, 2, 3)) == data
+    [completed] = server.completed
+    assert completed["parts"] == [
+        {"partNumber": n, "etag": f"etag-{n}"} for n in (1, 2, 3)
+    ]
+    assert completed["fname"] == "out.mp4"
+    assert completed["mimeType"] == "video/mp4"
+    assert not server.forms
+
+
+def test_failed_part_is_retried(server, connector):
+    server.part_failures[2] = [503]
+    data = _payload(2 * MIN_PART_SIZE)
+
+    connector.put_bytes(data, "videos/retry.mp4")
+
+    assert server.attempts[2] == 2
+    assert b"".join(server.parts[n] for n in (1, 2)) == data
+    assert len(server.completed) == 1
+
+
+def test_failing_part_aborts_the_upload(server, connector):
+    server.part_failures[2] = [400]
+
+    with pytest.raises(requests.HTTPError):
+        connector.put_bytes(_payload(2 * MIN_PART_SIZE), "videos/broken.mp4")
+
+    assert server.aborted == ["upload-1"]
+    assert not server.completed
+
+
+def test_up_host_is_resolved_once_per_bucket(server, monkeypatch, tmp_path):
+    lookups = []
+
+    def get_up_host_by_token(region, token, home_dir):
+        lookups.append((region.scheme, region.home_dir, home_dir))
+        return server.url + "/"
+
+    monkeypatch.setattr(
+        "common.qiniu_conn.Region.get_up_host_by_token", get_up_host_by_token
+    )
+    connector = QiNiuConnector(
+        "ak", "sk", "bucket", "cdn.example.com", hosts_cache_dir=str(tmp_path)
+    )
+    connector.put_bytes(b"a", "inputs/a.png")
+    connector.put_bytes(b"b", "inputs/b.png")
+
+    assert lookups == [("https", str(tmp_path), str(tmp_path))]
+    assert [form["key"] for form in server.forms] == ["inputs/a.png", "inputs/b.png"]
+
+
+def test_failed_up_host_lookup_falls_back_and_retries(server, monkeypatch):
+    lookups = []
+
+    def get_up_host_by_token(region, token, home_dir):
+        lookups.append(token)
+        if len(lookups) == 1:
+            raise OSError("read-only file system")
+        return server.url
+
+    monkeypatch.setattr(
+        "common.qiniu_conn.Region.get_up_host_by_token", get_up_host_by_token
+    )
+    connector = QiNiuConnector(
+        "ak", "sk", "bucket", "cdn.example.com", fallback_up_host=server.url
+    )
+    connector.put_bytes(b"a", "inputs/a.png")
+    connector.put_bytes(b"b", "inputs/b.png")
+    connector.put_bytes(b"c", "inputs/c.png")
+
+    assert len(lookups) == 2
+    assert len(server.forms) == 3
@@ -0,0 +1,39 @@
+import pytest
+
+from common.storage import parse_range
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("BYTES = 10-20", (10, 20)),
+    ],
+)
+def test_satisfiable_ranges(value, expected):
+    assert parse_range(value, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "items=0-10",
+        "bytes=0-10,20-30",
+        "bytes=10",
+        "bytes=-",
+        "bytes=a-b",
+        "bytes=20-10",
+    ],
+)
+def test_ignored_ranges(value):
+    assert parse_range(value, 1000) is None
+
+
+@pytest.mark.parametrize("value", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(value):
+    with pytest.raises(ValueError):
+        parse_range(value, 1000)
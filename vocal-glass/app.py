@@ -4,6 +4,8 @@ from assistants.chains import build_vision_chat_chain
 from assistants.llms import get_llm
 from assistants.sys_prompts import DEFAULT_2
 from chainlit.utils import mount_chainlit
+from common.metrics import instrument
+from common.storage import LocalStorage
 from fastapi import FastAPI, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -11,6 +13,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from loguru import logger
 from starlette.requests import Request
+from storage_conn import get_storage
 from voice_server_clients import call_stt, call_tts
 
 app = FastAPI()
@@ -22,12 +25,17 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
 )
+instrument(app)
 
 
 # Static files and templates setup
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+storage = get_storage()
+if isinstance(storage, LocalStorage):
+    app.mount("/files", storage.asgi_app())
+
 
 @app.get("/ui", response_class=HTMLResponse)
 async def get_home(request: Request):
@@ -8,8 +8,16 @@ class EnvironmentSettings(BaseSettings):
     llm_name: str
     memory_uri: str
     voice_server_url: str
-    qiniu_ak: str
-    qiniu_sk: str
+    storage_backend: str = "qiniu"  # `qiniu` or `local`
+    qiniu_ak: str = ""
+    qiniu_sk: str = ""
+    qiniu_bucket_name: str = "knowledge9base"
+    qiniu_bucket_domain: str = "knowledge.fugetech.com"
+    # empty resolves the upload host of the bucket's region
+    qiniu_up_host: str = ""
+    # local backend, files are served by this app under /files
+    local_storage_dir: str = "/tmp/vocal-glass-storage"
+    local_storage_url: str = "http://127.0.0.1:8000/files"
 
     class Config:
         env_file = ".env"
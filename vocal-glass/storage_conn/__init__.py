@@ -0,0 +1,20 @@
+from functools import lru_cache
+
+from common.qiniu_conn import QiNiuConnector
+from common.storage import LocalStorage, Storage
+from config import env_settings
+
+
+@lru_cache(1)
+def get_storage() -> Storage:
+    if env_settings.storage_backend == "local":
+        return LocalStorage(
+            env_settings.local_storage_dir, env_settings.local_storage_url
+        )
+    return QiNiuConnector(
+        ak=env_settings.qiniu_ak,
+        sk=env_settings.qiniu_sk,
+        bucket_name=env_settings.qiniu_bucket_name,
+        bucket_domain=env_settings.qiniu_bucket_domain,
+        up_host=env_settings.qiniu_up_host,
+    )
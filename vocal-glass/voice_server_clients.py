@@ -5,7 +5,7 @@ import aiohttp
 import shortuuid
 from config import env_settings
 from loguru import logger
-from storage_conn.qiniu_conn import get_qiniu
+from storage_conn import get_storage
 
 
 async def call_tts(text: str) -> str | None:
@@ -24,9 +24,9 @@ async def call_tts(text: str) -> str | None:
                             break
                         audio_file.write(chunk)
                 if os.path.exists(file_path):
-                    q = get_qiniu()
-                    file_key = q.upload_file(file_path, "audio_assets")
-                    audio_url = q.get_public_url(file_key)
+                    storage = get_storage()
+                    file_key = await storage.aupload_file(file_path, "audio_assets")
+                    audio_url = storage.get_public_url(file_key)
                     logger.info(f"audio url: {audio_url}")
                     return audio_url
             else:
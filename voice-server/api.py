@@ -5,18 +5,28 @@ import librosa
 import numpy as np
 import regex as re
 import soundfile as sf
+from common.metrics import observe_tts, track_inference
+from common.prompt_cache import sd3_prompt_kwargs
 from loguru import logger
-from models import load_f5_tts_model, load_sd35_model, load_whisper_model
+from models import (
+    get_prompt_cache,
+    load_f5_tts_model,
+    load_sd35_model,
+    load_whisper_model,
+)
+from PIL import Image
 
 
 def transcribe_audio(buffer: BytesIO) -> str:
     try:
         whisper_model = load_whisper_model()
         start = time.time()
-        segs, _ = whisper_model.transcribe(buffer, beam_size=5)
+        with track_inference("whisper"):
+            segs, _ = whisper_model.transcribe(buffer, beam_size=5)
+            # segments are decoded lazily, while iterating
+            res = " ".join([seg.text for seg in segs])
         tot = time.time() - start
         logger.debug(f"Transcription time: {tot:.2f} seconds")
-        res = " ".join([seg.text for seg in segs])
         return res
     except Exception as e:
         logger.error(f"Transcription error: {e}")
@@ -44,6 +54,7 @@ def text_to_speech(text: str) -> BytesIO:
         generation_time = time.time() - t0
         audio_duration = len(wav_np) / sr
         rtf = generation_time / audio_duration
+        observe_tts("f5_tts", generation_time, audio_duration)
         logger.debug(f"Generated in {generation_time:.2f}s")
         logger.debug(f"Real-Time Factor (RTF): {rtf:.2f}")
         wav_np = np.clip(wav_np, -1, 1)
@@ -64,19 +75,22 @@ def text_to_speech(text: str) -> BytesIO:
         raise
 
 
-def text_to_image(text: str) -> BytesIO:
+def text_to_image(text: str) -> Image.Image:
     pipeline = load_sd35_model()
 
     # Generate the image
-    image = pipeline(
-        prompt=text,
-        num_inference_steps=28,
-        guidance_scale=4.5,
-        max_sequence_length=512,
-    ).images[0]
-
-    # Convert the image to a BytesIO object
-    image_bytes = BytesIO()
-    image.save(image_bytes, format="PNG")
-    image_bytes.seek(0)
-    return image_bytes
+    with track_inference("sd35"):
+        embeds = sd3_prompt_kwargs(
+            pipeline,
+            get_prompt_cache(),
+            [text],
+            max_sequence_length=512,
+            guidance_scale=4.5,
+        )
+        image = pipeline(
+            num_inference_steps=28,
+            guidance_scale=4.5,
+            max_sequence_length=512,
+            **embeds,
+        ).images[0]
+    return image
@@ -1,11 +1,16 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import Optional
 
 from api import text_to_image, text_to_speech, transcribe_audio
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from common.image_encoding import encode_image, media_type, negotiate_format
+from common.metrics import instrument
+from fastapi import FastAPI, File, Header, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 app = FastAPI()
 
@@ -16,6 +21,10 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
 )
+instrument(app)
+
+# the SD3.5 pipeline is not thread safe, generations take turns on one thread
+sd35_executor = ThreadPoolExecutor(1, thread_name_prefix="sd35")
 
 
 class TTSRequest(BaseModel):
@@ -24,6 +33,9 @@ class TTSRequest(BaseModel):
 
 class ImageGenRequest(BaseModel):
     text: str
+    # png, webp, jpeg or avif, defaults to what the Accept header prefers
+    format: Optional[str] = None
+    quality: Optional[int] = Field(None, ge=1, le=100)
 
 
 @app.post("/tts")
@@ -55,11 +67,16 @@ async def stt(file: UploadFile = File(...)):
 
 
 @app.post("/generate_image")
-async def generate_image(request: ImageGenRequest):
+async def generate_image(request: ImageGenRequest, accept: str = Header(None)):
+    try:
+        fmt = negotiate_format(request.format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        image_bytes = text_to_image(request.text)
-        # Return the image as a streaming response
-        return StreamingResponse(image_bytes, media_type="image/png")
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(sd35_executor, text_to_image, request.text)
+        content = await asyncio.to_thread(encode_image, image, fmt, request.quality)
+        return Response(content, media_type=media_type(fmt), headers={"Vary": "Accept"})
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
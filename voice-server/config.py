@@ -6,6 +6,16 @@ class EnvironmentSettings(BaseSettings):
     f5_model_path: str
     whisper_model_path: str
     sd35_model_path: str
+    # see common/exec_profile.py
+    sd35_exec_profile: str = "auto"
+    sd35_exec_headroom_gb: float = 6.0
+    sd35_vae_slicing: bool = False
+    sd35_vae_tiling: bool = False
+    sd35_cpu_threads: int = 0
+    # LRU of prompt embeddings, evicted entries spill to the directory if set
+    sd35_prompt_cache_mb: int = 512
+    sd35_prompt_cache_dir: str = ""
+    sd35_prompt_cache_disk_mb: int = 4096
 
     class Config:
         env_file = ".env"
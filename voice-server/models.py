@@ -1,6 +1,8 @@
 from functools import lru_cache
 
 import torch
+from common.exec_profile import apply_profile, execution_device, resolve_profile
+from common.prompt_cache import PromptCache
 from config import env_settings
 from diffusers import (
     BitsAndBytesConfig,
@@ -33,24 +35,55 @@ def load_whisper_model():
 
 @lru_cache(1)
 def load_sd35_model():
-    nf4_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.bfloat16,
-    )
+    device = execution_device(env_settings.sd35_exec_profile)
+    if device == "cuda":
+        nf4_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+        model_nf4 = SD3Transformer2DModel.from_pretrained(
+            env_settings.sd35_model_path,
+            subfolder="transformer",
+            quantization_config=nf4_config,
+            torch_dtype=torch.bfloat16,
+        )
+        pipeline = StableDiffusion3Pipeline.from_pretrained(
+            env_settings.sd35_model_path,
+            transformer=model_nf4,
+            torch_dtype=torch.bfloat16,
+        )
+    else:
+        # bitsandbytes 4-bit kernels are cuda only
+        pipeline = StableDiffusion3Pipeline.from_pretrained(
+            env_settings.sd35_model_path,
+            torch_dtype=torch.float32,
+        )
 
-    model_nf4 = SD3Transformer2DModel.from_pretrained(
-        env_settings.sd35_model_path,
-        subfolder="transformer",
-        quantization_config=nf4_config,
-        torch_dtype=torch.bfloat16,
+    profile = resolve_profile(
+        env_settings.sd35_exec_profile,
+        pipeline,
+        device,
+        headroom_bytes=int(env_settings.sd35_exec_headroom_gb * 2**30),
+        name="sd35",
     )
-
-    pipeline = StableDiffusion3Pipeline.from_pretrained(
-        env_settings.sd35_model_path,
-        transformer=model_nf4,
-        torch_dtype=torch.bfloat16,
+    apply_profile(
+        pipeline,
+        profile,
+        device,
+        vae_slicing=env_settings.sd35_vae_slicing,
+        vae_tiling=env_settings.sd35_vae_tiling,
+        cpu_threads=env_settings.sd35_cpu_threads,
     )
-    pipeline.enable_model_cpu_offload()
     logger.info("sd35 loaded")
     return pipeline
+
+
+@lru_cache(1)
+def get_prompt_cache() -> PromptCache:
+    return PromptCache(
+        max_bytes=env_settings.sd35_prompt_cache_mb * 2**20,
+        spill_dir=env_settings.sd35_prompt_cache_dir,
+        spill_max_bytes=env_settings.sd35_prompt_cache_disk_mb * 2**20,
+        name="sd35_prompt",
+    )
@@ -1,61 +1,263 @@
+import asyncio
 import os
+import time
+from collections import defaultdict
+from typing import Union
 
 import shortuuid
-from celery import Celery
+from celery.signals import worker_process_init
+from celery_batches import Batches
 from loguru import logger
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 
+from common.celery_client import (
+    IMG_TO_VIDEO_BATCH_TASK,
+    IMG_TO_VIDEO_TASK,
+    create_celery_app,
+)
 from common.config import env_settings
-from common.qiniu_conn import get_qiniu
-from worker.tasks.health_check import simulate_long_task
-from worker.tasks.svd import generate_video_from_img
+from common.metrics import INFERENCE_SECONDS, start_metrics_server
+from common.queue_stats import mark_finished, mark_started
+from common.redis_conn import get_redis_conn
+from common.renditions import DEFAULT_RENDITIONS, RENDITIONS, rendition_urls
+from common.result_cache import get_result_cache
+from common.storage import get_storage
+from common.svd_presets import DEFAULT_QUALITY, PRESETS
+from common.task_progress import ProgressReporter
+from common.task_timing import StageTimer, record_timings
+from common.worker_health import start_heartbeat
+from worker.tasks.input_cache import InputCache
 
-qiniu = get_qiniu()
+storage = get_storage()
+redis_conn = get_redis_conn()
+result_cache = get_result_cache()
+input_cache = InputCache(
+    storage,
+    root=os.path.join(env_settings.DATA_DIR, "svd_cache", "inputs"),
+    max_bytes=env_settings.SVD_INPUT_CACHE_BYTES,
+)
+OUTPUT_DIR = os.path.join(env_settings.DATA_DIR, "svd_outputs")
 
-HOST = env_settings.REDIS_HOST
-PORT = env_settings.REDIS_PORT
-PWD = env_settings.REDIS_PWD
+# torch and diffusers are only imported by the pool processes, see
+# `init_worker_process`, so flower and other tools loading this module stay light
+app = create_celery_app(include=["worker.tasks"])
+# one message at a time, acked once done, so a slow task never holds queued
+# jobs hostage; batched tasks are only flushed once a full batch is prefetched
+app.conf.worker_prefetch_multiplier = max(1, env_settings.SVD_BATCH_SIZE)
+app.conf.task_acks_late = True
+# the pool child loads and warms the model before reporting itself up
+app.conf.worker_proc_alive_timeout = 600
 
 
-app = Celery(
-    "video-gen-tasks",
-    broker=f"redis://:{PWD}@{HOST}:{PORT}/0",
-    backend=f"redis://:{PWD}@{HOST}:{PORT}/0",
-    include=["worker.tasks"],
-)
-app.conf.task_serializer = "json"
-app.conf.result_expires = 86400  # 1 day in seconds
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    input_cache.start_cleaner(env_settings.SVD_INPUT_CACHE_SWEEP_SECONDS)
+    if env_settings.SVD_WORKER_METRICS_PORT:
+        start_metrics_server(env_settings.SVD_WORKER_METRICS_PORT)
+    from worker.tasks import svd
+
+    start_heartbeat(
+        redis_conn,
+        lambda: {
+            "device": svd.get_device(),
+            "gpu": os.environ.get("CUDA_VISIBLE_DEVICES", ""),
+            "model_loaded": int(svd.is_pipe_loaded()),
+        },
+    )
+    if env_settings.SVD_WARMUP:
+        svd.warmup_pipe()
+
+
+def _output_paths(renditions: list[str]) -> dict[str, str]:
+    vid = shortuuid.ShortUUID().random(length=11)
+    # the API validates renditions, unknown ones can only come from old clients
+    names = [name for name in renditions if name in RENDITIONS]
+    return {
+        name: os.path.join(OUTPUT_DIR, f"vid-{vid}{RENDITIONS[name]}")
+        for name in names or DEFAULT_RENDITIONS
+    }
+
+
+async def _upload_renditions(output_paths: dict[str, str]) -> dict[str, str]:
+    keys = await asyncio.gather(
+        *[
+            storage.aput_file(path, f"svd_materials/{os.path.basename(path)}")
+            for path in output_paths.values()
+        ]
+    )
+    return dict(zip(output_paths, keys))
+
+
+def _finalize_video(output_paths: dict[str, str], cache_key: str = None) -> dict:
+    keys = asyncio.run(_upload_renditions(output_paths))
+    if cache_key:
+        result_cache.store(cache_key, keys)
+    return rendition_urls(keys, storage.get_public_url)
+
 
+def _resolve_inputs(jobs: list[dict], timers: list[StageTimer]) -> list[str]:
+    """Local paths of the job inputs, empty for those that could not be fetched."""
+    image_paths = []
+    for job, timer in zip(jobs, timers):
+        try:
+            with timer.stage("download"):
+                image_paths.append(input_cache.resolve(job["input"]))
+        except Exception as exc:
+            logger.error(f"Error fetching input of task {job['task_id']}: {exc}")
+            image_paths.append("")
+    return image_paths
 
-@app.task(name="health_check")
-def test_celery(a: int, b: int):
-    x = simulate_long_task()
-    res = x + a + b
-    return {"result": res}
 
+def _run_group(
+    jobs: list[dict],
+    motion_bucket_id: int,
+    noise_aug_strength: float,
+    quality: str = DEFAULT_QUALITY,
+) -> list[dict]:
+    """Generate videos for jobs sharing parameters, one result per job.
 
-@app.task(name="img_to_video")
-def img_to_video(image_path: str) -> dict:
+    A job is a dict with `task_id`, `input` (an input reference, see
+    `InputCache.resolve`), the `renditions` to produce and an optional
+    `cache_key`. Successful results
+    carry the stage timings and peak memory of the run; stages shared by
+    the batch are reported with the time of the whole batch.
+    """
+    from worker.tasks import svd
+
+    task_ids = [job["task_id"] for job in jobs]
+    progress = ProgressReporter(redis_conn, task_ids)
+    output_paths = [
+        _output_paths(job.get("renditions") or DEFAULT_RENDITIONS) for job in jobs
+    ]
+    batch_timer = StageTimer()
+    timers = [StageTimer() for _ in jobs]
+    started_at = time.time()
+    mark_started(redis_conn, task_ids)
+    rss_reset = svd.reset_peak_memory()
     try:
-        file_dir = os.path.dirname(image_path)
-        vid = shortuuid.ShortUUID().random(length=11)
-        output_path = os.path.join(file_dir, f"vid-{vid}.mp4")
-        ok = generate_video_from_img(
-            image_path=image_path,
-            output_path=output_path,
-        )
-
-        if ok:
-            clip = VideoFileClip(output_path)
-            clip = concatenate_videoclips([clip])
-            clip.write_videofile(output_path)
-            video_key = qiniu.upload_file(
-                output_path,
-                upload_dir="svd_materials",
+        image_paths = _resolve_inputs(jobs, timers)
+        fetched = [i for i, image_path in enumerate(image_paths) if image_path]
+        oks = [False] * len(jobs)
+        if fetched:
+            generated = svd.generate_videos_from_imgs(
+                image_paths=[image_paths[i] for i in fetched],
+                output_paths=[output_paths[i] for i in fetched],
+                motion_bucket_id=motion_bucket_id,
+                noise_aug_strength=noise_aug_strength,
+                quality=quality,
+                progress=progress,
+                timer=batch_timer,
             )
-            os.remove(image_path)
-            os.remove(output_path)
-            return {"url": f"https://{env_settings.QINIU_BUCKET_DOMAIN}/{video_key}"}
+            for i, ok in zip(fetched, generated):
+                oks[i] = ok
+        results = []
+        for i, (job, output_path, ok) in enumerate(zip(jobs, output_paths, oks)):
+            progress.update("upload", i, len(jobs))
+            result = {}
+            if ok:
+                try:
+                    with timers[i].stage("upload"):
+                        result = _finalize_video(output_path, job.get("cache_key"))
+                except Exception as exc:
+                    logger.error(f"Error generating video: {exc}")
+            results.append(result)
+
+        total = time.time() - started_at
+        memory = svd.peak_memory(rss_reset)
+        if "diffusion" in batch_timer.seconds:
+            INFERENCE_SECONDS.labels("svd").observe(batch_timer.seconds["diffusion"])
+        entries = []
+        for job, timer, result in zip(jobs, timers, results):
+            for name, seconds in batch_timer.seconds.items():
+                timer.add(name, seconds)
+            timer.add("total", total)
+            entry = {
+                "task_id": job["task_id"],
+                "quality": quality,
+                "batch_size": len(jobs),
+                "ok": bool(result),
+                "timings": timer.as_dict(),
+                "peak_memory": memory,
+            }
+            entries.append(entry)
+            if result:
+                result.update(timings=entry["timings"], peak_memory=memory)
+        record_timings(redis_conn, entries)
+        return results
+    finally:
+        mark_finished(redis_conn, task_ids, time.time() - started_at)
+        for job, paths in zip(jobs, output_paths):
+            if job.get("cache_key"):
+                result_cache.release(job["cache_key"], job["task_id"])
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+@app.task(name=IMG_TO_VIDEO_TASK, bind=True)
+def img_to_video(
+    self,
+    image: Union[str, dict],
+    motion_bucket_id: int = 32,
+    noise_aug_strength: float = 0.02,
+    cache_key: str = None,
+    quality: str = DEFAULT_QUALITY,
+    renditions: list[str] = DEFAULT_RENDITIONS,
+) -> dict:
+    if quality not in PRESETS:
+        logger.error(f"Unknown quality preset: {quality}")
+        return {}
+    job = {
+        "task_id": self.request.id,
+        "input": image,
+        "cache_key": cache_key,
+        "renditions": renditions,
+    }
+    try:
+        return _run_group([job], motion_bucket_id, noise_aug_strength, quality)[0]
     except Exception as exc:
         logger.error(f"Error generating video: {exc}")
     return {}
+
+
+@app.task(
+    name=IMG_TO_VIDEO_BATCH_TASK,
+    base=Batches,
+    flush_every=env_settings.SVD_BATCH_SIZE,
+    flush_interval=env_settings.SVD_BATCH_WAIT,
+)
+def img_to_video_batch(requests) -> None:
+    # only tasks sharing a preset and conditioning can go through one call
+    groups = defaultdict(list)
+    for request in requests:
+        kwargs = request.kwargs or {}
+        quality = kwargs.get("quality", DEFAULT_QUALITY)
+        if quality not in PRESETS:
+            logger.error(f"Unknown quality preset: {quality}")
+            app.backend.mark_as_done(request.id, {}, request=request)
+            continue
+        motion_bucket_id = kwargs.get("motion_bucket_id", 32)
+        noise_aug_strength = kwargs.get("noise_aug_strength", 0.02)
+        key = (quality, motion_bucket_id, noise_aug_strength)
+        job = {
+            "task_id": request.id,
+            "input": request.args[0],
+            "cache_key": kwargs.get("cache_key"),
+            "renditions": kwargs.get("renditions"),
+        }
+        groups[key].append((request, job))
+
+    for (quality, motion_bucket_id, noise_aug_strength), items in groups.items():
+        logger.info(f"Running batch of {len(items)} {quality} img_to_video tasks")
+        try:
+            results = _run_group(
+                [job for _, job in items],
+                motion_bucket_id,
+                noise_aug_strength,
+                quality,
+            )
+        except Exception as exc:
+            logger.error(f"Error generating video: {exc}")
+            results = [{}] * len(items)
+        for (request, _), result in zip(items, results):
+            app.backend.mark_as_done(request.id, result, request=request)
@@ -0,0 +1,88 @@
+"""Start one celery worker process per visible GPU.
+
+Each worker is pinned to its device through CUDA_VISIBLE_DEVICES and runs a
+single pool process. Without GPUs a single CPU worker is started instead.
+
+    python -m worker.launch --loglevel=info
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+from loguru import logger
+
+from common.config import env_settings
+
+
+def visible_gpus() -> list[str]:
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [d.strip() for d in visible.split(",") if d.strip() not in ("", "-1")]
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [line.strip() for line in out.splitlines() if line.strip()]
+
+
+def worker_cmd(name: str, loglevel: str) -> list[str]:
+    return [
+        sys.executable,
+        "-m",
+        "celery",
+        "-A",
+        "worker.app",
+        "worker",
+        f"--loglevel={loglevel}",
+        "--concurrency=1",
+        "-n",
+        f"{name}@%h",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loglevel", type=str, default="info")
+    args = parser.parse_args()
+
+    gpus = visible_gpus()
+    if gpus:
+        specs = [(f"svd-gpu{gpu}", gpu, "cuda") for gpu in gpus]
+    else:
+        logger.warning("No GPU found, starting a single CPU worker")
+        specs = [("svd-cpu", "", "cpu")]
+
+    base_port = env_settings.SVD_WORKER_METRICS_PORT
+    procs = []
+    for i, (name, gpu, device) in enumerate(specs):
+        env = {**os.environ, "CUDA_VISIBLE_DEVICES": gpu, "SVD_DEVICE": device}
+        if base_port:
+            env["SVD_WORKER_METRICS_PORT"] = str(base_port + i)
+        proc = subprocess.Popen(worker_cmd(name, args.loglevel), env=env)
+        logger.info(f"Started {name} (pid {proc.pid}) on {device} {gpu}")
+        procs.append(proc)
+
+    def shutdown(signum, frame):
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    code = 0
+    for proc in procs:
+        code = proc.wait() or code
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
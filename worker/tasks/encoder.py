@@ -0,0 +1,174 @@
+import shutil
+import subprocess
+from typing import Iterable, Union
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+Frames = Union[np.ndarray, Iterable[Image.Image]]
+
+BOOMERANG_WIDTH = 512
+
+
+def get_ffmpeg_exe() -> str:
+    exe = shutil.which("ffmpeg")
+    if exe:
+        return exe
+    # imageio-ffmpeg ships a static binary and is already pulled in by moviepy
+    import imageio_ffmpeg
+
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def _rawvideo_input(width: int, height: int, fps: int) -> list[str]:
+    return [
+        get_ffmpeg_exe(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-an",
+    ]
+
+
+def _h264_args(crf: int, preset: str) -> list[str]:
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-crf",
+        str(crf),
+        # yuv420p with even dimensions is what browsers can actually play
+        "-pix_fmt",
+        "yuv420p",
+        "-movflags",
+        "+faststart",
+    ]
+
+
+def _frame_size(frames: Frames) -> tuple[Frames, int, int]:
+    if isinstance(frames, np.ndarray):
+        if frames.ndim != 4 or frames.shape[-1] != 3:
+            raise ValueError(f"Expected (n, h, w, 3) frames, got {frames.shape}")
+        return frames, frames.shape[2], frames.shape[1]
+    frames = iter(frames)
+    first = next(frames)
+    w, h = first.size
+
+    def chain():
+        yield first
+        yield from frames
+
+    return chain(), w, h
+
+
+def encode_frames(
+    frames: Frames,
+    output_path: str,
+    fps: int = 6,
+    crf: int = 23,
+    preset: str = "medium",
+) -> None:
+    """Encode RGB frames into a browser-compatible H.264 mp4 in a single pass.
+
+    `frames` is either a uint8 array of shape (n, h, w, 3) or an iterable of
+    RGB PIL images; each frame is piped to ffmpeg as soon as it is available.
+    """
+    frames, width, height = _frame_size(frames)
+    cmd = [
+        *_rawvideo_input(width, height, fps),
+        "-vf",
+        "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+        *_h264_args(crf, preset),
+        output_path,
+    ]
+    _pipe_frames(cmd, frames)
+
+
+def _pipe_frames(cmd: list[str], frames: Frames) -> None:
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for frame in frames:
+            if isinstance(frame, Image.Image):
+                frame = np.asarray(frame.convert("RGB"))
+            proc.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+    except BrokenPipeError:
+        pass
+    finally:
+        # flushes and closes stdin so ffmpeg can finalize the file
+        _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        msg = stderr.decode(errors="replace").strip()
+        logger.error(f"ffmpeg failed with code {proc.returncode}: {msg}")
+        raise RuntimeError(f"Video encoding failed: {msg}")
+
+
+def _rendition_args(name: str, crf: int, preset: str) -> list[str]:
+    if name in ("mp4", "boomerang"):
+        return _h264_args(crf, preset)
+    if name == "webm":
+        # vp9 needs a higher crf than x264 for a similar size and quality
+        return [
+            "-c:v",
+            "libvpx-vp9",
+            "-crf",
+            str(crf + 10),
+            "-b:v",
+            "0",
+            "-deadline",
+            "good",
+            "-cpu-used",
+            "4",
+            "-row-mt",
+            "1",
+            "-pix_fmt",
+            "yuv420p",
+        ]
+    if name == "poster":
+        return ["-frames:v", "1", "-q:v", "2"]
+    raise ValueError(f"Unknown rendition: {name}")
+
+
+def encode_renditions(
+    frames: np.ndarray,
+    output_paths: dict[str, str],
+    fps: int = 6,
+    crf: int = 23,
+    preset: str = "medium",
+) -> None:
+    """Produce every requested rendition in a single ffmpeg run.
+
+    `frames` is a uint8 array of shape (n, h, w, 3) and `output_paths` maps
+    rendition names (see common.renditions) to files. The frames are piped
+    once and fanned out by a `split` filter, nothing is decoded back.
+    """
+    frames, width, height = _frame_size(frames)
+    names = list(output_paths)
+    outputs = "".join(f"[s{i}]" for i in range(len(names)))
+    graph = [f"[0:v]pad=ceil(iw/2)*2:ceil(ih/2)*2,split={len(names)}{outputs}"]
+    for i, name in enumerate(names):
+        if name == "boomerang":
+            # plays forward then backward so it loops without a visible cut
+            graph.append(
+                f"[s{i}]split[f{i}][b{i}];[b{i}]reverse[r{i}];"
+                f"[f{i}][r{i}]concat=n=2:v=1:a=0,scale={BOOMERANG_WIDTH}:-2[o{i}]"
+            )
+        else:
+            graph.append(f"[s{i}]null[o{i}]")
+
+    cmd = [*_rawvideo_input(width, height, fps), "-filter_complex", ";".join(graph)]
+    for i, name in enumerate(names):
+        cmd += ["-map", f"[o{i}]", *_rendition_args(name, crf, preset)]
+        cmd.append(output_paths[name])
+    _pipe_frames(cmd, frames)
@@ -1,6 +0,0 @@
-import time
-
-
-def simulate_long_task():
-    time.sleep(10)
-    return 10
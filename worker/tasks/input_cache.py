@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Union
+
+from loguru import logger
+
+from common.result_cache import hash_file
+from common.storage import Storage
+
+# files touched this recently may be in use by a task on this node
+MIN_IDLE_SECONDS = 600
+
+
+class InputCache:
+    """Size-capped, least recently used on-disk cache of task input images.
+
+    Inputs are referenced by `{"key": <object key>, "sha256": <hex>}` and
+    stored as `<sha256><ext>`, so every worker on a node shares one copy.
+    """
+
+    def __init__(self, storage: Storage, root: str, max_bytes: int):
+        self.storage = storage
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def resolve(self, ref: Union[str, dict]) -> str:
+        """Return a local path for an input reference, downloading on a miss."""
+        if isinstance(ref, str):
+            # legacy tasks carry a path on a disk shared with the API
+            return ref
+        ext = os.path.splitext(ref["key"])[1]
+        path = os.path.join(self.root, f"{ref['sha256']}{ext}")
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=".fetch-")
+        try:
+            tmp_path = self.storage.download_file(ref["key"], tmp_dir)
+            if not tmp_path:
+                raise IOError(f"Failed to download {ref['key']}")
+            if hash_file(tmp_path) != ref["sha256"]:
+                raise IOError(f"Checksum mismatch for {ref['key']}")
+            os.replace(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return path
+
+    def sweep(self):
+        """Evict the least recently used inputs until under the size cap."""
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.startswith(".fetch-"):
+                    # leftovers of a worker killed mid-download
+                    if time.time() - entry.stat().st_mtime > MIN_IDLE_SECONDS:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < MIN_IDLE_SECONDS:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+        if total > self.max_bytes:
+            logger.warning(f"Input cache over its cap with {total} bytes in use")
+
+    def start_cleaner(self, interval: float):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("Input cache sweep failed")
+
+        thread = threading.Thread(target=loop, name="input-cache-cleaner", daemon=True)
+        thread.start()
+        return thread
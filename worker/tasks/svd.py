@@ -1,57 +1,303 @@
 import math
+import resource
+import time
+from contextlib import contextmanager
 from functools import lru_cache
+from typing import Optional
 
+import numpy as np
 import torch
+import torch.nn.functional as F
 from diffusers import StableVideoDiffusionPipeline
-from diffusers.utils import export_to_video, load_image
+from diffusers.utils import load_image
 from loguru import logger
 from PIL import Image, UnidentifiedImageError
 
 from common.config import env_settings
+from common.exec_profile import apply_profile, execution_device, resolve_profile
+from common.svd_presets import DEFAULT_QUALITY, PRESETS, SvdPreset
+from common.task_progress import ProgressReporter
+from common.task_timing import StageTimer
+from worker.tasks.encoder import encode_renditions
+
+
+def get_device() -> str:
+    return execution_device(env_settings.SVD_EXEC_PROFILE, env_settings.SVD_DEVICE)
 
 
 @lru_cache(1)
 def load_pipe():
+    device = get_device()
+    # fp16 kernels are not available for most ops on cpu
+    dtype = torch.float16 if device == "cuda" else torch.float32
     pipe = StableVideoDiffusionPipeline.from_pretrained(
         env_settings.SVD_MODEL_DIR,
-        torch_dtype=torch.float16,
+        torch_dtype=dtype,
         variant="fp16",
     )
-    pipe.enable_model_cpu_offload()
+    profile = resolve_profile(
+        env_settings.SVD_EXEC_PROFILE,
+        pipe,
+        device,
+        headroom_bytes=int(env_settings.SVD_EXEC_HEADROOM_GB * 2**30),
+        name="SVD",
+    )
+    # the temporal VAE has no slicing, decode_chunk_size bounds its memory
+    apply_profile(
+        pipe,
+        profile,
+        device,
+        vae_slicing=env_settings.SVD_VAE_SLICING,
+        vae_tiling=env_settings.SVD_VAE_TILING,
+        cpu_threads=env_settings.SVD_CPU_THREADS,
+    )
+    logger.info(f"SVD pipeline loaded on {device}")
     return pipe
 
 
-def generate_video_from_img(
-    image_path: str,
-    output_path: str,
+def is_pipe_loaded() -> bool:
+    return load_pipe.cache_info().currsize > 0
+
+
+def warmup_pipe() -> bool:
+    """Load the pipeline and run a throwaway inference so the first real
+    task does not pay for weight loading and kernel selection.
+
+    Failures are logged, not raised: the first task retries loading.
+    """
+    try:
+        pipe = load_pipe()
+        if get_device() == "cuda":
+            preset = PRESETS[DEFAULT_QUALITY]
+            width, height = preset.width, preset.height
+        else:
+            # both sides must be multiples of 64 for the UNet down blocks
+            width, height = 256, 128
+        image = Image.new("RGB", (width, height))
+        with torch.inference_mode():
+            pipe(
+                image,
+                width=width,
+                height=height,
+                num_frames=2,
+                num_inference_steps=1,
+                decode_chunk_size=2,
+            )
+    except Exception:
+        logger.exception("SVD warmup failed")
+        return False
+    logger.info("SVD pipeline warmed up")
+    return True
+
+
+def _prepare_image(image_path: str, preset: SvdPreset) -> tuple[Image.Image, int]:
+    """Load and resize the input image, return it with the output frame height."""
+    image = load_image(image_path)
+    w, h = image.size
+    aspect_ratio = h / w
+    image = image.resize((preset.width, preset.height), Image.Resampling.LANCZOS)
+    height = math.floor(preset.width * aspect_ratio)
+    return image, height
+
+
+def _restore_aspect(video: torch.Tensor, width: int, height: int) -> np.ndarray:
+    """Resize all frames of one video at once.
+
+    `video` is (frames, channels, h, w) in [0, 1]; returns a contiguous
+    (frames, height, width, 3) uint8 array the encoder can stream as is.
+    """
+    video = F.interpolate(
+        video.float(),
+        size=(height, width),
+        mode="bicubic",
+        align_corners=False,
+        antialias=True,
+    )
+    video = video.clamp_(0, 1).mul_(255).round_().to(torch.uint8)
+    return video.permute(0, 2, 3, 1).contiguous().cpu().numpy()
+
+
+def _vm_hwm_mb() -> Optional[float]:
+    """Resident high water mark since the last reset, None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory() -> bool:
+    """Start a new peak measurement, return whether RSS could be reset."""
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    try:
+        # "5" resets VmHWM to the current RSS (Linux >= 4.0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory(rss_reset: bool = True) -> dict:
+    """Peak resident memory and, on GPU, peak allocated VRAM since the reset.
+
+    Without a resettable VmHWM only the lifetime peak of the worker process
+    is known, reported as `process_rss_mb` so it is not mistaken for the
+    task's own.
+    """
+    hwm = _vm_hwm_mb() if rss_reset else None
+    if hwm is not None:
+        usage = {"rss_mb": round(hwm, 1)}
+    else:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage = {"process_rss_mb": round(max_rss / 1024, 1)}
+    if torch.cuda.is_available():
+        usage["cuda_max_allocated_mb"] = round(
+            torch.cuda.max_memory_allocated() / 2**20, 1
+        )
+    return usage
+
+
+@contextmanager
+def _track_vae_decode(
+    pipe,
+    progress: Optional[ProgressReporter],
+    timer: StageTimer,
+    total_chunks: int,
+):
+    """Time and report every `decode_chunk_size` chunk the VAE decodes."""
+    vae = pipe.vae
+    decode = vae.decode
+    sync = torch.cuda.synchronize if torch.cuda.is_available() else lambda: None
+    done = 0
+
+    def tracked_decode(*args, **kwargs):
+        nonlocal done
+        # kernels run asynchronously, wait for the denoiser before the clock starts
+        sync()
+        start = time.perf_counter()
+        out = decode(*args, **kwargs)
+        sync()
+        timer.add("vae_decode", time.perf_counter() - start)
+        done += 1
+        if progress is not None:
+            progress.update("decode", done, total_chunks)
+        return out
+
+    vae.decode = tracked_decode
+    try:
+        yield
+    finally:
+        del vae.decode
+
+
+def generate_videos_from_imgs(
+    image_paths: list[str],
+    output_paths: list[dict[str, str]],
     motion_bucket_id: int = 32,
-    noise_aug_strength: int = 0.02,
-) -> bool:
+    noise_aug_strength: float = 0.02,
+    quality: str = DEFAULT_QUALITY,
+    progress: Optional[ProgressReporter] = None,
+    timer: Optional[StageTimer] = None,
+) -> list[bool]:
+    """Run one batched pipeline call for images sharing the same parameters.
+
+    `output_paths` maps rendition names to files for each input. Returns a
+    success flag per input, in order. Stage times of the whole batch are
+    added to `timer`.
+    """
+    timer = timer if timer is not None else StageTimer()
     pipe = load_pipe()
+    preset = PRESETS[quality]
+    if progress is not None:
+        progress.update("preprocess")
+    results = [False] * len(image_paths)
+    prepared: list[tuple[int, Image.Image, int]] = []
+    with timer.stage("preprocess"):
+        for idx, image_path in enumerate(image_paths):
+            try:
+                image, height = _prepare_image(image_path, preset)
+                prepared.append((idx, image, height))
+            except UnidentifiedImageError:
+                logger.error(f"Image file could not be identified: {image_path}")
+            except IOError:
+                logger.error(f"An I/O error occurred while reading {image_path}")
+
+    if not prepared:
+        return results
+
+    pipe_kwargs = dict(
+        width=preset.width,
+        height=preset.height,
+        num_frames=preset.num_frames,
+        num_inference_steps=preset.num_inference_steps,
+        decode_chunk_size=preset.decode_chunk_size,
+        motion_bucket_id=motion_bucket_id,
+        noise_aug_strength=noise_aug_strength,
+        # (batch, frames, channels, h, w) tensor, no per-frame PIL images
+        output_type="pt",
+    )
+    if progress is not None:
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            progress.update("denoise", step + 1, preset.num_inference_steps)
+            return callback_kwargs
+
+        pipe_kwargs["callback_on_step_end"] = on_step_end
+    total_chunks = math.ceil(
+        len(prepared) * preset.num_frames / preset.decode_chunk_size
+    )
+
+    # diffusion is the pipeline call minus the time spent in the VAE
+    decode_before = timer.seconds["vae_decode"]
+    start = time.perf_counter()
     try:
-        image = load_image(image_path)
-        w, h = image.size
-        aspect_ratio = h / w
-        image = image.resize((1024, 576), Image.Resampling.LANCZOS)
-        imgs: list[Image.Image] = []
-        width = 1024
-        height = math.floor(width * aspect_ratio)
-
-        frames = pipe(
-            image,
-            decode_chunk_size=8,
-            motion_bucket_id=motion_bucket_id,
-            noise_aug_strength=noise_aug_strength,
-        ).frames[0]
-        imgs = [img.resize((width, height), Image.Resampling.LANCZOS) for img in frames]
-        export_to_video(imgs, output_path, fps=6)
-        logger.info(f"Video generated: {output_path}")
-        return True
-    except UnidentifiedImageError as e:
-        logger.error("Image file could not be identified.", exc_info=True)
-    except IOError as e:
-        logger.error("An I/O error occurred while processing the image.", exc_info=True)
-    except Exception as e:
+        with _track_vae_decode(pipe, progress, timer, total_chunks):
+            videos = pipe([image for _, image, _ in prepared], **pipe_kwargs).frames
+    except Exception:
         logger.error("An unexpected error occurred.", exc_info=True)
+        return results
+    finally:
+        decoded = timer.seconds["vae_decode"] - decode_before
+        timer.add("diffusion", time.perf_counter() - start - decoded)
+
+    if progress is not None:
+        progress.update("encode")
+
+    with timer.stage("encode"):
+        for (idx, _, height), frames in zip(prepared, videos):
+            try:
+                encode_renditions(
+                    _restore_aspect(frames, preset.width, height),
+                    output_paths[idx],
+                    fps=6,
+                    crf=env_settings.VIDEO_CRF,
+                    preset=env_settings.VIDEO_PRESET,
+                )
+                logger.info(f"Video generated: {output_paths[idx]}")
+                results[idx] = True
+            except Exception:
+                logger.error("An unexpected error occurred.", exc_info=True)
+    return results
 
-    return False
+
+def generate_video_from_img(
+    image_path: str,
+    output_path: str,
+    motion_bucket_id: int = 32,
+    noise_aug_strength: float = 0.02,
+    quality: str = DEFAULT_QUALITY,
+    progress: Optional[ProgressReporter] = None,
+) -> bool:
+    return generate_videos_from_imgs(
+        [image_path],
+        [{"mp4": output_path}],
+        motion_bucket_id=motion_bucket_id,
+        noise_aug_strength=noise_aug_strength,
+        quality=quality,
+        progress=progress,
+    )[0]
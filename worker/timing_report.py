@@ -0,0 +1,60 @@
+"""Summarize the stage timings of recent img_to_video tasks.
+
+python -m worker.timing_report --last 500 --quality final
+"""
+
+import argparse
+import json
+
+from common.redis_conn import get_redis_conn
+from common.task_timing import TIMINGS_WINDOW, load_timings, percentile, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--last", type=int, default=TIMINGS_WINDOW)
+    parser.add_argument("--quality", type=str, default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    entries = [
+        entry
+        for entry in load_timings(get_redis_conn(), args.last)
+        if entry.get("ok") and args.quality in (None, entry.get("quality"))
+    ]
+    summary = summarize(entries)
+    rss = [
+        entry["peak_memory"]["rss_mb"]
+        for entry in entries
+        if "rss_mb" in entry["peak_memory"]
+    ]
+    vram = [
+        entry["peak_memory"]["cuda_max_allocated_mb"]
+        for entry in entries
+        if "cuda_max_allocated_mb" in entry["peak_memory"]
+    ]
+    memory = {
+        "rss_mb": {"p50": percentile(rss, 50), "p95": percentile(rss, 95)},
+        "cuda_max_allocated_mb": {
+            "p50": percentile(vram, 50),
+            "p95": percentile(vram, 95),
+        },
+    }
+
+    if args.json:
+        print(json.dumps({"tasks": len(entries), "stages": summary, **memory}))
+        return
+
+    print(f"{len(entries)} successful tasks")
+    print(f"{'stage':<12} {'count':>6} {'p50 s':>9} {'p95 s':>9}")
+    for name, stats in summary.items():
+        print(
+            f"{name:<12} {stats['count']:>6} {stats['p50']:>9.2f} {stats['p95']:>9.2f}"
+        )
+    for name, stats in memory.items():
+        if stats["p50"] is not None:
+            print(f"{name:<22} p50 {stats['p50']:>9.1f} p95 {stats['p95']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()